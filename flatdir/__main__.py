@@ -4,25 +4,31 @@ from __future__ import annotations
 
 from argparse import ArgumentParser
 from configparser import ConfigParser, ParsingError
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from datetime import timedelta
 from importlib import resources
-import locale
-from locale import LC_NUMERIC, LC_MONETARY, setlocale
 import logging
 from logging import getLogger
 from pathlib import Path
 import sys
-from typing import cast
-from urllib.parse import urlsplit
+from time import sleep
+from typing import TYPE_CHECKING, cast
 
-from jinja2 import Environment, PackageLoader
+from .directory import VERSION, Company, Directory, create_process_pool
+from .util import HTTPClient, color_stream_handler
+from .web import WebGenerator
 
-from .directory import Company, Directory, VERSION
-from .util import color_stream_handler, copy_resource
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+_RETRY_INTERVAL = timedelta(minutes=5)
+_COMPANY_FLOAT_OPTIONS = ['fetch_timeout', 'min_refresh_interval', 'max_refresh_interval',
+                          'refresh_jitter']
 
 @dataclass
 class _Namespace:
-    config: str | None = None
+    config: list[str] = field(default_factory=list)
+    serve: bool = False
 
 def main(*args: str) -> int:
     """Run flatdir with the given command-line *args*."""
@@ -34,30 +40,130 @@ def main(*args: str) -> int:
     parser = ArgumentParser(
         prog='python3 -m flatdir',
         description='Aggregate flat ads from different real estate companies.')
-    parser.add_argument('config', nargs='?',
-                        help='Path to config file. By default flatdir.ini, if present.')
+    parser.add_argument(
+        'config', nargs='*',
+        help='Path to config file of a place, or to a directory of config files (*.ini) of '
+             'multiple places. By default flatdir.ini, if present.')
+    parser.add_argument(
+        '--serve', action='store_true',
+        help='Keep running, update each company once its document expires and regenerate the web '
+             'directory if any ads changed.')
     ns = parser.parse_args(args[1:], namespace=_Namespace())
 
+    config_paths: list[Path | None] = []
+    for arg in ns.config:
+        path = Path(arg)
+        if path.is_dir():
+            paths = sorted(path.glob('*.ini'))
+            if not paths:
+                logger.critical('Failed to load config files from %s (No *.ini files)', path)
+                return 1
+            config_paths += paths
+        else:
+            config_paths.append(path)
+    if not config_paths:
+        default_path = Path('flatdir.ini')
+        config_paths.append(default_path if default_path.exists() else None)
+
+    configs = []
+    for config_path in config_paths:
+        config = _load_config(config_path)
+        if not config:
+            return 1
+        configs.append((config_path, config))
+
+    # All places share a single pool of parser workers, started before any update threads
+    parse_processes = []
+    for config_path, config in configs:
+        try:
+            parse_processes.append(config.getint('flatdir', 'parse_processes'))
+        except ValueError:
+            logger.critical('Failed to load config file %s ([flatdir] Bad parse_processes type)',
+                            config_path)
+            return 1
+
+    process_pool = None
+    # Places with the same user agent share an HTTP client and thus its connections
+    http_clients: dict[str, HTTPClient] = {}
+    try:
+        if max(parse_processes) > 0:
+            process_pool = create_process_pool(max(parse_processes))
+
+        generators = []
+        for (config_path, config), place_parse_processes in zip(configs, parse_processes):
+            generator = _load_place(config_path, config, place_parse_processes, process_pool,
+                                    http_clients)
+            if not generator:
+                return 1
+            generators.append(generator)
+            if config_path:
+                logger.info('Loaded config file %s', config_path)
+
+        for generator in generators:
+            generator.directory.data_path.mkdir(exist_ok=True)
+        if ns.serve:
+            try:
+                _serve(generators)
+            except KeyboardInterrupt:
+                pass
+        else:
+            for generator in generators:
+                generator.directory.update()
+                _generate(generator)
+    except OSError as e:
+        logger.critical('Failed to access data directory (%s)', e.strerror)
+        return 2
+    finally:
+        for http_client in http_clients.values():
+            http_client.close()
+        if process_pool:
+            process_pool.shutdown()
+    return 0
+
+def _load_config(config_path: Path | None) -> ConfigParser | None:
+    # Load the config file at *config_path* over the default config. A missing default config file
+    # is given as None.
+    logger = getLogger(__name__)
     res = resources.files(f'{__package__}.res')
     config = ConfigParser(strict=False, interpolation=None)
     with (res / 'default.ini').open(encoding='utf-8') as f:
         config.read_file(f)
+    if config_path:
+        try:
+            with config_path.open(encoding='utf-8') as f:
+                config.read_file(f)
+        except OSError as e:
+            logger.critical('Failed to load config file %s (%s)', config_path, e.strerror)
+            return None
+        except ParsingError as e:
+            number, line = e.errors[0]
+            logger.critical('Failed to load config file %s (Bad line %d %s)', config_path, number,
+                            line.strip("'"))
+            return None
+    return config
 
-    config_path: Path | None = Path(ns.config or 'flatdir.ini')
-    assert config_path
+def _load_place(config_path: Path | None, config: ConfigParser, parse_processes: int,
+                process_pool: ProcessPoolExecutor | None,
+                http_clients: dict[str, HTTPClient]) -> WebGenerator | None:
+    # Set up the directory and web generator of a place from its *config*, with its validated
+    # *parse_processes*
+    logger = getLogger(__name__)
+    # Company options with a default in [flatdir]
+    floats: dict[str, float] = {}
+    for key in _COMPANY_FLOAT_OPTIONS:
+        try:
+            floats[key] = config.getfloat('flatdir', key)
+        except ValueError:
+            logger.critical('Failed to load config file %s ([flatdir] Bad %s type)', config_path,
+                            key)
+            return None
     try:
-        with config_path.open(encoding='utf-8') as f:
-            config.read_file(f)
-    except OSError as e:
-        if ns.config:
-            logger.critical('Failed to load config file %s (%s)', config_path, e.strerror)
-            return 1
-        config_path = None
-    except ParsingError as e:
-        number, line = e.errors[0]
-        logger.critical('Failed to load config file %s (Bad line %d %s)', config_path, number,
-                        line.strip("'"))
-        return 1
+        concurrency = config.getint('flatdir', 'concurrency')
+    except ValueError:
+        logger.critical('Failed to load config file %s ([flatdir] Bad concurrency type)',
+                        config_path)
+        return None
+    html_parser = config.get('flatdir', 'html_parser')
 
     companies = []
     for name, options in config.items():
@@ -67,71 +173,95 @@ def main(*args: str) -> int:
             except ValueError:
                 logger.critical('Failed to load config file %s ([%s] Bad rooms_optional type)',
                                 config_path, name)
-                return 1
+                return None
+            company_floats: dict[str, float] = {}
+            for key, default in floats.items():
+                try:
+                    company_floats[key] = options.getfloat(key, default)
+                except ValueError:
+                    logger.critical('Failed to load config file %s ([%s] Bad %s type)',
+                                    config_path, name, key)
+                    return None
             try:
                 company = Company(
                     options['url'], options['ad_path'], options['url_path'], options['title_path'],
                     options['location_path'], options['rooms_path'], options['rent_field'],
                     rooms_optional=rooms_optional,
-                    location_filter=cast(str, options.get('location_filter', '')))
+                    location_filter=cast(str, options.get('location_filter', '')),
+                    fetch_timeout=company_floats['fetch_timeout'],
+                    html_parser=options.get('html_parser', html_parser),
+                    min_refresh_interval=company_floats['min_refresh_interval'],
+                    max_refresh_interval=company_floats['max_refresh_interval'],
+                    refresh_jitter=company_floats['refresh_jitter'])
             except KeyError as e:
                 logger.critical('Failed to load config file %s ([%s] Missing %s)', config_path,
                                 name, str(e).strip("'"))
-                return 1
+                return None
             except ValueError as e:
                 logger.critical('Failed to load config file %s ([%s] %s)', config_path, name, e)
-                return 1
+                return None
             companies.append(company)
 
     options = config['flatdir']
-    directory_locale = options['locale']
-    try:
-        setlocale(LC_NUMERIC, directory_locale)
-        setlocale(LC_MONETARY, directory_locale)
-    except locale.Error:
-        logger.critical('Failed to load config file %s ([flatdir] Unknown locale %s)', config_path,
-                        directory_locale)
-        return 1
-
+    user_agent = options['user_agent'] or f'flatdir/{VERSION}'
+    http_client = http_clients.get(user_agent)
+    if not http_client:
+        http_client = HTTPClient(user_agent=user_agent)
+        http_clients[user_agent] = http_client
     try:
         directory = Directory(companies, title=options['title'], description=options['description'],
-                              extra=options['extra'], data_path=options['data_path'])
+                              extra=options['extra'], data_path=options['data_path'],
+                              concurrency=concurrency, store=options['store'],
+                              parse_processes=parse_processes, locale=options['locale'],
+                              process_pool=process_pool if parse_processes else None,
+                              http_client=http_client)
     except ValueError as e:
         logger.critical('Failed to load config file %s ([flatdir] %s)', config_path, e)
-        return 1
+        return None
 
-    url = options['url']
-    components = urlsplit(url)
-    if not (components.scheme and components.hostname):
-        logger.critical('Failed to load config file %s ([flatdir] Relative url %s)', config_path,
-                        url)
-        return 1
+    try:
+        page_size = config.getint('flatdir', 'page_size')
+    except ValueError:
+        logger.critical('Failed to load config file %s ([flatdir] Bad page_size type)',
+                        config_path)
+        return None
+    try:
+        return WebGenerator(directory, options['url'], page_size=page_size)
+    except ValueError as e:
+        logger.critical('Failed to load config file %s ([flatdir] %s)', config_path, e)
+        return None
 
-    if config_path:
-        logger.info('Loaded config file %s', config_path)
+def _generate(generator: WebGenerator) -> None:
+    index_path = generator.generate()
+    getLogger(__name__).info('Generated web directory %s', index_path)
 
-    templates = Environment(autoescape=True, loader=PackageLoader(f'{__package__}.res', '.'))
-    template = templates.get_template('template.html')
+def _serve(generators: list[WebGenerator]) -> None:
+    # Update each company when its document expires and generate the web directory of its place on
+    # changes
+    due = {company: company.get_next_update_time()
+           for generator in generators for company in generator.directory.companies}
+    statuses: list[list[bool] | None] = [None] * len(generators)
+    while True:
+        for i, generator in enumerate(generators):
+            directory = generator.directory
+            now = directory.now()
+            companies = [company for company in directory.companies if due[company] <= now]
+            changed = directory.update(companies) if companies else []
+            for company in companies:
+                # Space out attempts if an update failed
+                due[company] = max(company.get_next_update_time(), now + _RETRY_INTERVAL)
 
-    try:
-        directory.data_path.mkdir(exist_ok=True)
-        directory.update()
-
-        setlocale(LC_NUMERIC, 'C')
-        setlocale(LC_MONETARY, 'C')
-        web_path = directory.data_path / 'web'
-        web_path.mkdir(exist_ok=True)
-        copy_resource(res / 'fonts', web_path / 'fonts')
-        copy_resource(res / 'images', web_path / 'images')
-        html = template.render(directory=directory, companies=companies, ads=directory.get_ads(),
-                               url=url, version=VERSION)
-        index_path = web_path / 'index.html'
-        index_path.write_text(html)
-    except OSError as e:
-        logger.critical('Failed to access data directory (%s)', e.strerror)
-        return 2
+            old_statuses = statuses[i]
+            statuses[i] = [company.is_ok() for company in directory.companies]
+            if changed or statuses[i] != old_statuses:
+                _generate(generator)
 
-    logger.info('Generated web directory %s', index_path)
-    return 0
+        if not due:
+            getLogger(__name__).warning('No companies to update')
+            return
+        delay = (min(due.values()) - generators[0].directory.now()).total_seconds()
+        if delay > 0:
+            sleep(delay)
 
-sys.exit(main(*sys.argv))
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv))
@@ -0,0 +1,92 @@
+"""Microbenchmarks.
+
+Run all benchmarks with ``python3 -m flatdir.benchmarks``.
+
+Results can be saved as baseline, to which later results are compared. A result that is more than
+:data:`REGRESSION_THRESHOLD` worse than the baseline is flagged as regression.
+
+.. data:: REGRESSION_THRESHOLD
+
+   Relative change from the baseline considered a regression.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+import json
+from os import PathLike
+from pathlib import Path
+from timeit import Timer
+import tracemalloc
+from typing import cast
+
+REGRESSION_THRESHOLD = 0.1
+
+_results: dict[str, float] = {}
+_baseline: dict[str, float] = {}
+
+def measure(func: Callable[[], object], *, repeat: int = 5) -> float:
+    """Measure the time in seconds a call of *func* takes.
+
+    The best of *repeat* runs is returned, where each run calls *func* for at least 0.2 seconds.
+    """
+    timer = Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+def measure_memory(func: Callable[[], object]) -> int:
+    """Measure the memory in bytes the result of *func* takes."""
+    tracemalloc.start()
+    try:
+        result = func()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+def measure_peak_memory(func: Callable[[], object]) -> int:
+    """Measure the peak memory in bytes a call of *func* allocates."""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def report(name: str, seconds: float, *, items: int = 1) -> None:
+    """Print the result of the benchmark *name*, which processed *items* in *seconds* per call."""
+    print(f'{name:<48} {seconds * 1e6:12.2f} µs {items / seconds:14.0f} items/s'
+          f'{_compare(name, seconds)}')
+
+def report_memory(name: str, size: int, *, items: int = 1) -> None:
+    """Print the result of the memory benchmark *name*, which kept *items* in *size* bytes."""
+    print(f'{name:<48} {size / 1e6:12.2f} MB {size / items:14.0f} B/item{_compare(name, size)}')
+
+def load_baseline(path: PathLike[str] | str) -> None:
+    """Load the baseline from the JSON file at *path*, if it exists."""
+    try:
+        baseline = cast(object, json.loads(Path(path).read_text(encoding='utf-8')))
+    except FileNotFoundError:
+        return
+    if isinstance(baseline, dict):
+        _baseline.update(cast(dict[str, float], baseline))
+
+def save_baseline(path: PathLike[str] | str) -> None:
+    """Save all results reported so far as baseline to the JSON file at *path*.
+
+    Results of benchmarks which were not run are kept.
+    """
+    baseline = _baseline | _results
+    Path(path).write_text(json.dumps(baseline, indent=4, sort_keys=True) + '\n',
+                          encoding='utf-8')
+
+def _compare(name: str, value: float) -> str:
+    # Record the result and describe its change from the baseline
+    _results[name] = value
+    base = _baseline.get(name)
+    if not base:
+        return ''
+    change = value / base - 1
+    return f' {change:+8.1%}{" regression" if change > REGRESSION_THRESHOLD else ""}'
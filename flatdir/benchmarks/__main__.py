@@ -0,0 +1,38 @@
+"""Run benchmarks."""
+
+from argparse import ArgumentParser
+from dataclasses import dataclass, field
+
+from . import ad, load_baseline, number, pipeline, save_baseline, startup, table
+
+@dataclass
+class _Namespace:
+    benchmarks: list[str] = field(default_factory=list)
+    baseline: str = 'benchmark-baseline.json'
+    save_baseline: bool = False
+
+BENCHMARKS = {
+    'ad': ad.main,
+    'number': number.main,
+    'table': table.main,
+    'startup': startup.main,
+    'pipeline': pipeline.main
+}
+
+parser = ArgumentParser(prog='python3 -m flatdir.benchmarks', description='Run benchmarks.')
+parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                    help=f'Benchmark to run, one of {", ".join(BENCHMARKS)}. By default all.')
+parser.add_argument('--baseline',
+                    help='Path to baseline file to compare results to. By default '
+                         'benchmark-baseline.json.')
+parser.add_argument('--save-baseline', action='store_true', help='Save results as baseline.')
+ns = parser.parse_args(namespace=_Namespace())
+unknown = set(ns.benchmarks) - BENCHMARKS.keys()
+if unknown:
+    parser.error(f'Unknown benchmark {", ".join(sorted(unknown))}')
+
+load_baseline(ns.baseline)
+for name in ns.benchmarks or BENCHMARKS:
+    BENCHMARKS[name]()
+if ns.save_baseline:
+    save_baseline(ns.baseline)
@@ -0,0 +1,27 @@
+"""Ad memory benchmark."""
+
+from __future__ import annotations
+
+from datetime import datetime
+
+from flatdir.directory import Ad
+from . import measure, measure_memory, report, report_memory
+
+def main() -> None:
+    """Run the benchmark."""
+    n = 100000
+    time = datetime(2023, 2, 3, 20)
+    # Simulate values of a store, where equal strings are distinct objects
+    rows = [('example.org', f'https://example.org/{i}', f'Flat {i}', ''.join(['Mit', 'te']), 2.0,
+             1000.0, time)
+            for i in range(n)]
+
+    def create() -> list[Ad]:
+        return [Ad(url, title, location, rooms, rent, time)
+                for _, url, title, location, rooms, rent, time in rows]
+    def create_from_store() -> list[Ad]:
+        return [Ad.from_store(*row) for row in rows]
+
+    report('ad: Ad()', measure(create, repeat=3), items=n)
+    report('ad: Ad.from_store()', measure(create_from_store, repeat=3), items=n)
+    report_memory('ad: memory', measure_memory(create_from_store), items=n)
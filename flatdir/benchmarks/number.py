@@ -0,0 +1,30 @@
+"""Number parser benchmark."""
+
+from __future__ import annotations
+
+from locale import atof, localeconv
+import re
+
+from flatdir.util import NumberParser
+from . import measure, report
+
+def _parse_number_locale(value: str | int | float) -> float:
+    # Reference implementation, compiling the pattern and consulting the locale on every call
+    if isinstance(value, (int, float)):
+        return float(value)
+    conv = localeconv()
+    decimal = re.escape(conv['decimal_point'])
+    group = re.escape(conv['thousands_sep'])
+    match = re.search(rf'\d[{group}\d]*({decimal}\d+)?', value)
+    return atof(match[0]) if match else .0
+
+def main() -> None:
+    """Run the benchmark."""
+    values: list[str | int | float] = ['€499.99', 'Almost 1.5', '3 rooms', 'On request', 2000] * 200
+    parser = NumberParser.from_locale()
+    report('number: locale (reference)',
+           measure(lambda: [_parse_number_locale(value) for value in values]), items=len(values))
+    report('number: NumberParser.parse',
+           measure(lambda: [parser.parse(value) for value in values]), items=len(values))
+    report('number: NumberParser.parse_all', measure(lambda: parser.parse_all(values)),
+           items=len(values))
@@ -0,0 +1,135 @@
+"""Update and render pipeline benchmark.
+
+Synthetic company documents in HTML and JSON with :data:`SIZES` ads are served from a local HTTP
+server.
+
+.. data:: SIZES
+
+   Numbers of ads per document.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from html import escape
+import json
+import logging
+from pathlib import Path
+from random import Random
+from tempfile import TemporaryDirectory
+from threading import Thread
+from typing import cast
+
+from flatdir.directory import Company, Directory
+from flatdir.util import query_json, query_xml
+from flatdir.web import WebGenerator
+from . import measure, measure_peak_memory, report, report_memory
+
+SIZES = [10, 1000, 50000]
+
+_LOCATIONS = ['Mitte', 'Kreuzberg', 'Neukölln', 'Pankow', 'Spandau', 'Wedding']
+
+class _RequestHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format: str, *args: object) -> None:
+        # Disable logging
+        # pylint: disable=redefined-builtin
+        pass
+
+def _generate_ads(n: int) -> list[tuple[str, str, str, float, float]]:
+    random = Random(n)
+    return [(f'flat-{i}.html', f'Flat {i} with {random.choice(["balcony", "garden", "view"])}',
+             f'{random.choice(_LOCATIONS)}, Berlin', random.randint(1, 5),
+             round(random.uniform(300, 3000), 2))
+            for i in range(n)]
+
+def _generate_html(n: int) -> str:
+    items = '\n'.join(
+        f'<li class="ad"><a href="{url}">{escape(title)}</a> <span>{escape(location)}</span> '
+        f'<span>{rooms:g}</span> <span>€{rent:.2f}</span></li>'
+        for url, title, location, rooms, rent in _generate_ads(n))
+    return (f'<!DOCTYPE html>\n<html lang="en"><head><title>Flats</title></head>'
+            f'<body><ul>\n{items}\n</ul></body></html>\n')
+
+def _generate_json(n: int) -> str:
+    ads: list[dict[str, object]] = [
+        {'url': url, 'title': title, 'location': location, 'rooms': rooms, 'rent': rent}
+        for url, title, location, rooms, rent in _generate_ads(n)
+    ]
+    document: dict[str, object] = {'ads': ads}
+    return json.dumps(document)
+
+def _benchmark(name: str, func: Callable[[], object], *, items: int, repeat: int) -> None:
+    report(name, measure(func, repeat=repeat), items=items)
+    report_memory(f'{name} peak', measure_peak_memory(func), items=items)
+
+def _benchmark_company(path: Path, url: str, n: int) -> None:
+    # pylint: disable=protected-access
+    ext = Path(url).suffix
+    data_path = path / f'data{ext}-{n}'
+    data_path.mkdir()
+    if ext == '.html':
+        company = Company(url, ".//li[@class='ad']", 'a/@href', 'a', 'span[1]:[^,]*', 'span[2]',
+                          'span[3]')
+    else:
+        company = Company(url, 'ads.*', 'url', 'title', 'location:[^,]*', 'rooms', 'rent')
+    directory = Directory([company], data_path=data_path)
+    generator = WebGenerator(directory, 'https://flat.example.org')
+    prefix = f'pipeline: {ext[1:]} {n}'
+    repeat = 1 if n > 1000 else 5
+    data = (path / 'docs' / f'ads-{n}{ext}').read_bytes()
+
+    def clear_cache() -> None:
+        for file in data_path.glob(f'{company.host}.*'):
+            file.unlink()
+    def query() -> object:
+        clear_cache()
+        return company.query()
+    def update() -> object:
+        clear_cache()
+        return company.update()
+    def render() -> object:
+        (data_path / 'web-manifest.json').unlink(missing_ok=True)
+        return generator.generate()
+
+    _benchmark(f'{prefix} Company.query', query, items=n, repeat=repeat)
+    if ext == '.html':
+        _benchmark(f'{prefix} _parse_html', partial(company._parse_html, data), items=n,
+                   repeat=repeat)
+        tree = company._parse_html_tree(data)
+        _benchmark(f'{prefix} query_xml', partial(query_xml, tree, ".//li[@class='ad']"),
+                   items=n, repeat=repeat)
+    else:
+        _benchmark(f'{prefix} _parse_json', partial(company._parse_json, data), items=n,
+                   repeat=repeat)
+        document = cast(object, json.loads(data))
+        _benchmark(f'{prefix} query_json', partial(query_json, document, 'ads.*.title'), items=n,
+                   repeat=repeat)
+    _benchmark(f'{prefix} Company.update', update, items=n, repeat=repeat)
+    _benchmark(f'{prefix} Company.get_ads', company.get_ads, items=n, repeat=repeat)
+    _benchmark(f'{prefix} WebGenerator.generate', render, items=n, repeat=repeat)
+
+def main() -> None:
+    """Run the benchmark."""
+    logging.disable()
+    with TemporaryDirectory() as directory:
+        path = Path(directory)
+        docs_path = path / 'docs'
+        docs_path.mkdir()
+        for n in SIZES:
+            (docs_path / f'ads-{n}.html').write_text(_generate_html(n))
+            (docs_path / f'ads-{n}.json').write_text(_generate_json(n))
+
+        server = ThreadingHTTPServer(('localhost', 0),
+                                     partial(_RequestHandler, directory=str(docs_path)))
+        Thread(target=server.serve_forever).start()
+        try:
+            for n in SIZES:
+                for ext in ['.html', '.json']:
+                    _benchmark_company(
+                        path, f'http://localhost:{server.server_address[1]}/ads-{n}{ext}', n)
+        finally:
+            server.shutdown()
+            server.server_close()
+    logging.disable(logging.NOTSET)
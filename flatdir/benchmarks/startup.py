@@ -0,0 +1,50 @@
+"""Startup benchmark."""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+
+from jinja2 import Environment, FileSystemBytecodeCache, PackageLoader
+
+from . import measure, report
+
+def _run(*args: str, cwd: Path) -> None:
+    # Make the package importable from any working directory
+    root = str(Path(__file__).resolve().parents[2])
+    env = {**os.environ,
+           'PYTHONPATH': os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')]))}
+    subprocess.run([sys.executable, *args], cwd=cwd, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def main() -> None:
+    """Run the benchmark."""
+    with TemporaryDirectory() as directory:
+        path = Path(directory)
+        data_path = path / 'data'
+        cache_path = path / 'template-cache'
+        cache_path.mkdir()
+        # Directory without companies, so a cycle does not fetch anything
+        (path / 'flatdir.ini').write_text('[flatdir]\nurl = https://flat.example.org\n')
+
+        report('startup: import',
+               measure(lambda: _run('-c', 'import flatdir.directory, flatdir.web', cwd=path),
+                       repeat=3))
+        report('startup: template load',
+               measure(lambda: Environment(loader=PackageLoader('flatdir.res', '.'))
+                       .get_template('template.html')))
+        report('startup: template load (cached)',
+               measure(lambda: Environment(loader=PackageLoader('flatdir.res', '.'),
+                                           bytecode_cache=FileSystemBytecodeCache(str(cache_path)))
+                       .get_template('template.html')))
+
+        def cycle_cold() -> None:
+            shutil.rmtree(data_path, ignore_errors=True)
+            _run('-m', 'flatdir', cwd=path)
+        report('startup: python3 -m flatdir (cold)', measure(cycle_cold, repeat=3))
+        report('startup: python3 -m flatdir (no-op)',
+               measure(lambda: _run('-m', 'flatdir', cwd=path), repeat=3))
@@ -0,0 +1,33 @@
+"""Ad table benchmark."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from random import Random
+
+from flatdir.directory import Ad, AdTable
+from . import measure, report
+
+def main() -> None:
+    """Run the benchmark."""
+    random = Random(0)
+    locations = ['Mitte', 'Kreuzberg', 'Neukölln', 'Pankow', 'Spandau', 'Wedding']
+    time = datetime(2023, 2, 3, 20)
+    ads = [Ad(f'https://example.org/{i}', f'Flat {i}', random.choice(locations),
+              random.randint(1, 5), random.uniform(300, 3000), time + timedelta(minutes=i))
+           for i in range(100000)]
+    random.shuffle(ads)
+    table = AdTable(ads)
+
+    def time_key(ad: Ad) -> datetime:
+        return ad.time
+    def query_list() -> list[Ad]:
+        return sorted((ad for ad in ads
+                       if 1000 <= ad.rent <= 1100 and ad.rooms >= 2 and 'Mitte' in ad.location),
+                      key=time_key, reverse=True)
+    def query_table() -> list[Ad]:
+        return list(table.filter(min_rent=1000, max_rent=1100, min_rooms=2, location='Mitte'))
+
+    report('table: AdTable()', measure(lambda: AdTable(ads), repeat=3), items=len(ads))
+    report('table: query list (reference)', measure(query_list), items=len(ads))
+    report('table: AdTable.filter', measure(query_table), items=len(ads))
@@ -7,29 +7,47 @@
 
 from __future__ import annotations
 
+from abc import ABC, abstractmethod
 import csv
-from collections.abc import Iterable
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager, nullcontext
+from copy import copy
 import dataclasses
 from dataclasses import dataclass
 from datetime import datetime, timedelta
+import errno
+from hashlib import sha256
+from http import HTTPStatus
+from importlib.util import find_spec
+from io import StringIO
 import json
 from json import JSONDecodeError
-from locale import atof, localeconv
+from locale import Error as LocaleError, localeconv
 from logging import getLogger
 from os import PathLike
 from pathlib import Path
+from random import uniform
 import re
-from typing import ClassVar, TypeVar, cast, overload
-from urllib.error import URLError
+import signal
+import sys
+from threading import Lock
+from time import perf_counter
+from typing import TYPE_CHECKING, ClassVar, TypeVar, cast, overload
+from urllib.error import HTTPError, URLError
 from urllib.parse import urljoin, urlsplit
-from urllib.request import urlopen
-from urllib.response import addinfourl
 from xml.etree import ElementTree
 from xml.etree.ElementTree import Element
 
-import html5lib
+from .util import (AtomicWriter, HTTPClient, HTTPResponse, JSONPath, NumberParser, XMLPath,
+                   query_json, query_xml, stream_json, use_locale)
 
-from .util import query_json, query_xml
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing.context import BaseContext
+    import sqlite3
 
 VERSION = '0.6.4'
 
@@ -37,10 +55,12 @@ _T = TypeVar('_T')
 _U = TypeVar('_U')
 _V = TypeVar('_V')
 
-@dataclass
+@dataclass(slots=True)
 class Ad:
     """Flat advertisement.
 
+    The host and location are interned, as they are shared by many ads.
+
     .. attribute:: url
 
        URL of the ad.
@@ -76,21 +96,520 @@ class Ad:
     rooms: float
     rent: float
     time: datetime
+    host: str = dataclasses.field(init=False, repr=False, compare=False)
 
     def __post_init__(self) -> None:
-        self.host = urlsplit(self.url).hostname
-        if not self.host:
+        host = urlsplit(self.url).hostname
+        if not host:
             raise ValueError(f'Bad url {self.url}')
+        self.host = sys.intern(host)
         self.title = self.title.strip()
         if not self.title:
             raise ValueError('Blank title')
-        self.location = self.location.strip()
+        self.location = sys.intern(self.location.strip())
         if not self.location:
             raise ValueError('Blank location')
 
+    @classmethod
+    def from_store(cls, host: str, url: str, title: str, location: str, rooms: float, rent: float,
+                   time: datetime) -> Ad:
+        """Create an ad of the company at *host* from a trusted record of an :class:`AdStore`.
+
+        In contrast to the constructor, the arguments are not validated or normalized.
+        """
+        ad = cls.__new__(cls)
+        ad.url = url
+        ad.title = title
+        ad.location = sys.intern(location)
+        ad.rooms = rooms
+        ad.rent = rent
+        ad.time = time
+        ad.host = sys.intern(host)
+        return ad
+
+@dataclass
+class AdGroup:
+    """Group of ads of the same flat, listed by different real estate companies.
+
+    .. attribute:: ads
+
+       Ads of the flat, the first published one first.
+    """
+
+    ads: list[Ad]
+
+    @property
+    def ad(self) -> Ad:
+        """Representative ad, the first published one."""
+        return self.ads[0]
+
+    @property
+    def hosts(self) -> list[str]:
+        """Hostnames of the real estate companies listing the flat."""
+        return [ad.host for ad in self.ads]
+
+class AdTable(Sequence[Ad]):
+    """Columnar table of ads, ordered by publication time, newest first.
+
+    Rooms, rent and time are stored in arrays, host and location are dictionary-encoded. The table
+    is indexed by rent, rooms, location and host, so filtering does not touch any ad objects. Ads
+    are materialized only when accessed.
+
+    .. attribute:: hosts
+
+       Distinct hosts of the ads.
+
+    .. attribute:: locations
+
+       Distinct locations of the ads.
+    """
+
+    def __init__(self, ads: Iterable[Ad]) -> None:
+        def time_key(ad: Ad) -> datetime:
+            return ad.time
+
+        ads = sorted(ads, key=time_key, reverse=True)
+        host_codes: dict[str, int] = {}
+        location_codes: dict[str, int] = {}
+        self._urls = [ad.url for ad in ads]
+        self._titles = [ad.title for ad in ads]
+        self._host_codes = array('I', (host_codes.setdefault(ad.host, len(host_codes))
+                                       for ad in ads))
+        self._location_codes = array(
+            'I', (location_codes.setdefault(ad.location, len(location_codes)) for ad in ads))
+        self._rooms = array('d', (ad.rooms for ad in ads))
+        self._rent = array('d', (ad.rent for ad in ads))
+        self._times = [ad.time for ad in ads]
+        self.hosts = list(host_codes)
+        self.locations = list(location_codes)
+
+        # Indexes
+        self._rent_order = array('I', sorted(range(len(ads)), key=self._rent.__getitem__))
+        self._rent_sorted = array('d', (self._rent[row] for row in self._rent_order))
+        self._rooms_order = array('I', sorted(range(len(ads)), key=self._rooms.__getitem__))
+        self._rooms_sorted = array('d', (self._rooms[row] for row in self._rooms_order))
+        self._host_rows = [array('I') for _ in self.hosts]
+        for row, code in enumerate(self._host_codes):
+            self._host_rows[code].append(row)
+        self._location_rows = [array('I') for _ in self.locations]
+        for row, code in enumerate(self._location_codes):
+            self._location_rows[code].append(row)
+
+        self._rows: Sequence[int] = range(len(ads))
+
+    def filter(
+        self, *, min_rent: float | None = None, max_rent: float | None = None,
+        min_rooms: float | None = None, location: str = '', host: str | None = None
+    ) -> AdTable:
+        """Return a view of the ads matching all given criteria.
+
+        The rent must be between *min_rent* and *max_rent* and the number of rooms at least
+        *min_rooms*. The location must contain *location* and the ad must belong to the company at
+        *host*.
+        """
+        # Start with the smallest candidate set from the indexes, then check the other criteria
+        # against the columns
+        candidates: list[Sequence[int]] = []
+        if min_rent is not None or max_rent is not None:
+            start = 0 if min_rent is None else bisect_left(self._rent_sorted, min_rent)
+            stop = (len(self._rent_sorted) if max_rent is None
+                    else bisect_right(self._rent_sorted, max_rent))
+            candidates.append(self._rent_order[start:stop])
+        if min_rooms is not None:
+            candidates.append(self._rooms_order[bisect_left(self._rooms_sorted, min_rooms):])
+        location_codes = {code for code, name in enumerate(self.locations) if location in name}
+        if location:
+            candidates.append([row for code in location_codes
+                               for row in self._location_rows[code]])
+        host_code = self.hosts.index(host) if host in self.hosts else None
+        if host is not None:
+            candidates.append([] if host_code is None else self._host_rows[host_code])
+        if not candidates:
+            return self._view(self._rows)
+
+        rows = min(candidates, key=len)
+        view_rows = None if isinstance(self._rows, range) else set(self._rows)
+        return self._view(sorted(
+            row for row in rows
+            if (min_rent is None or self._rent[row] >= min_rent) and
+               (max_rent is None or self._rent[row] <= max_rent) and
+               (min_rooms is None or self._rooms[row] >= min_rooms) and
+               (not location or self._location_codes[row] in location_codes) and
+               (host is None or self._host_codes[row] == host_code) and
+               (view_rows is None or row in view_rows)))
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @overload
+    def __getitem__(self, key: int) -> Ad:
+        pass
+    @overload
+    def __getitem__(self, key: slice[int | None, int | None, int | None]) -> AdTable:
+        pass
+    def __getitem__(self, key: int | slice[int | None, int | None, int | None]) -> Ad | AdTable:
+        if not isinstance(key, int):
+            return self._view(self._rows[key])
+        row = self._rows[key]
+        return Ad.from_store(
+            self.hosts[self._host_codes[row]], self._urls[row], self._titles[row],
+            self.locations[self._location_codes[row]], self._rooms[row], self._rent[row],
+            self._times[row])
+
+    def _view(self, rows: Sequence[int]) -> AdTable:
+        # Return a table with the given rows, sharing columns and indexes
+        table = copy(self)
+        table._rows = rows
+        return table
+
+class AdStore(ABC):
+    """Storage of the ads of real estate companies.
+
+    .. attribute:: data_path
+
+       Path to data directory.
+
+    .. attribute:: writer
+
+       Writer for files in the data directory.
+    """
+
+    def __init__(
+        self, data_path: PathLike[str] | str, *, writer: AtomicWriter | None = None
+    ) -> None:
+        self.data_path = Path(data_path)
+        self.writer = writer or AtomicWriter()
+
+    @abstractmethod
+    def get_ads(self, host: str) -> list[Ad]:
+        """Get the stored ads of the company with *host*."""
+
+    @abstractmethod
+    def put_ads(self, host: str, ads: Iterable[Ad], *,
+                old_ads: Sequence[Ad] | None = None) -> list[Ad]:
+        """Replace the stored ads of the company with *host* by *ads*.
+
+        The publication time of already stored ads is kept. The resulting ads are returned. If the
+        currently stored ads are already known, they may be given as *old_ads* to avoid reading them
+        again.
+        """
+
+    @abstractmethod
+    def touch(self, host: str) -> None:
+        """Mark the stored ads of the company with *host* as up-to-date."""
+
+    @abstractmethod
+    def get_update_time(self, host: str) -> datetime | None:
+        """Get the time the ads of the company with *host* were last stored or marked up-to-date.
+
+        If no ads have been stored yet, ``None`` is returned.
+        """
+
+class CSVAdStore(AdStore):
+    """Ad storage with a CSV file per company, :file:`{host}.csv`."""
+
+    FIELDS: ClassVar[list[str]] = ['url', 'title', 'location', 'rooms', 'rent', 'time']
+
+    def get_ads(self, host: str) -> list[Ad]:
+        return self.read_csv(self.data_path / f'{host}.csv', host)
+
+    def put_ads(self, host: str, ads: Iterable[Ad], *,
+                old_ads: Sequence[Ad] | None = None) -> list[Ad]:
+        path = self.data_path / f'{host}.csv'
+        times = {ad.url: ad.time
+                 for ad in (self.read_csv(path, host) if old_ads is None else old_ads)}
+        ads = [dataclasses.replace(ad, time=times.get(ad.url, ad.time)) for ad in ads]
+
+        f = StringIO()
+        writer = csv.DictWriter(f, self.FIELDS)
+        writer.writeheader()
+        for ad in ads:
+            row = {
+                'url': ad.url,
+                'title': ad.title,
+                'location': ad.location,
+                'rooms': ad.rooms,
+                'rent': ad.rent,
+                'time': ad.time.isoformat()
+            }
+            writer.writerow(row)
+        self.writer.write_text(path, f.getvalue())
+        return ads
+
+    def touch(self, host: str) -> None:
+        (self.data_path / f'{host}.csv').touch()
+
+    def get_update_time(self, host: str) -> datetime | None:
+        try:
+            return datetime.fromtimestamp((self.data_path / f'{host}.csv').stat().st_mtime)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def read_csv(path: Path, host: str) -> list[Ad]:
+        """Read ads of the company at *host* from the CSV file at *path*.
+
+        If there is no file, the result is empty.
+        """
+        try:
+            with path.open(encoding='utf-8') as f:
+                return [
+                    Ad.from_store(
+                        host,
+                        row['url'],
+                        row['title'],
+                        row['location'],
+                        float(row['rooms']),
+                        # Update rent (0.6)
+                        float(row.get('rent', '0')),
+                        datetime.fromisoformat(row['time'])
+                    )
+                    for row in cast(Iterable[dict[str, str]], csv.DictReader(f))]
+        except FileNotFoundError:
+            return []
+
+class SQLiteAdStore(AdStore):
+    """Ad storage with a single SQLite database, :file:`ads.sqlite3`.
+
+    Ads are upserted by URL, so storing ads does not require reading them first. Existing CSV files
+    of :class:`CSVAdStore` are imported on first access of a company.
+
+    .. attribute:: path
+
+       Path to the database.
+    """
+
+    def __init__(
+        self, data_path: PathLike[str] | str, *, writer: AtomicWriter | None = None
+    ) -> None:
+        super().__init__(data_path, writer=writer)
+        self.path = self.data_path / 'ads.sqlite3'
+        self._setup = False
+        self._imported_hosts: set[str] = set()
+        self._lock = Lock()
+
+    def get_ads(self, host: str) -> list[Ad]:
+        with self._connect(host) as connection:
+            rows = cast(
+                list[tuple[str, str, str, float, float, str]],
+                connection.execute(
+                    'SELECT url, title, location, rooms, rent, time FROM ads WHERE host = ? '
+                    'ORDER BY rowid',
+                    (host, )
+                ).fetchall())
+        return [Ad.from_store(host, url, title, location, rooms, rent, datetime.fromisoformat(time))
+                for url, title, location, rooms, rent, time in rows]
+
+    def put_ads(self, host: str, ads: Iterable[Ad], *,
+                old_ads: Sequence[Ad] | None = None) -> list[Ad]:
+        ads = list(ads)
+        with self._connect(host) as connection:
+            connection.executemany(
+                'INSERT INTO ads (host, url, title, location, rooms, rent, time) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (host, url) DO UPDATE SET title = excluded.title, '
+                'location = excluded.location, rooms = excluded.rooms, rent = excluded.rent',
+                ((host, ad.url, ad.title, ad.location, ad.rooms, ad.rent, ad.time.isoformat())
+                 for ad in ads))
+            connection.execute('DELETE FROM temp.urls')
+            connection.executemany('INSERT OR IGNORE INTO temp.urls VALUES (?)',
+                                   ((ad.url, ) for ad in ads))
+            connection.execute('DELETE FROM ads WHERE host = ? AND url NOT IN temp.urls', (host, ))
+            self._set_update_time(connection, host)
+            times = dict(
+                cast(list[tuple[str, str]],
+                     connection.execute('SELECT url, time FROM ads WHERE host = ?',
+                                        (host, )).fetchall()))
+        return [dataclasses.replace(ad, time=datetime.fromisoformat(times[ad.url])) for ad in ads]
+
+    def touch(self, host: str) -> None:
+        with self._connect(host) as connection:
+            self._set_update_time(connection, host)
+
+    def get_update_time(self, host: str) -> datetime | None:
+        with self._connect(host) as connection:
+            row = cast(
+                tuple[str] | None,
+                connection.execute('SELECT update_time FROM companies WHERE host = ?',
+                                   (host, )).fetchone())
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def import_csv(self, host: str, path: Path) -> None:
+        """Import the ads of the company with *host* from the CSV file at *path*.
+
+        Ads that are already stored are skipped.
+        """
+        with self._connect(host, check_import=False) as connection:
+            self._import_csv(connection, host, path)
+
+    @contextmanager
+    def _connect(self, host: str, *, check_import: bool = True) -> Iterator[sqlite3.Connection]:
+        # Connecting is cheap and avoids sharing connections between threads. sqlite3 is only
+        # loaded when this store is used.
+        # pylint: disable=import-outside-toplevel
+        import sqlite3
+        try:
+            with closing(sqlite3.connect(self.path)) as connection:
+                with self._lock:
+                    if not self._setup:
+                        connection.executescript(self._SCHEMA)
+                        self._setup = True
+                connection.execute('CREATE TEMP TABLE urls (url TEXT PRIMARY KEY)')
+                with connection:
+                    if check_import and host not in self._imported_hosts:
+                        self._imported_hosts.add(host)
+                        path = self.data_path / f'{host}.csv'
+                        known = cast(
+                            object,
+                            connection.execute('SELECT 1 FROM companies WHERE host = ?',
+                                               (host, )).fetchone())
+                        if not known and path.exists():
+                            self._import_csv(connection, host, path)
+                    yield connection
+        except sqlite3.Error as e:
+            raise OSError(errno.EIO, f'{e} in {self.path}') from e
+
+    @staticmethod
+    def _import_csv(connection: sqlite3.Connection, host: str, path: Path) -> None:
+        ads = CSVAdStore.read_csv(path, host)
+        update_time = datetime.fromtimestamp(path.stat().st_mtime)
+        connection.executemany(
+            'INSERT OR IGNORE INTO ads (host, url, title, location, rooms, rent, time) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            ((host, ad.url, ad.title, ad.location, ad.rooms, ad.rent, ad.time.isoformat())
+             for ad in ads))
+        connection.execute('INSERT INTO companies VALUES (?, ?) ON CONFLICT (host) DO NOTHING',
+                           (host, update_time.isoformat()))
+        getLogger(__name__).info('Imported %d ad(s) of %s from %s', len(ads), host, path)
+
+    @staticmethod
+    def _set_update_time(connection: sqlite3.Connection, host: str) -> None:
+        connection.execute(
+            'INSERT INTO companies VALUES (?, ?) '
+            'ON CONFLICT (host) DO UPDATE SET update_time = excluded.update_time',
+            (host, datetime.now().isoformat()))
+
+    _SCHEMA: ClassVar[str] = """
+        CREATE TABLE IF NOT EXISTS ads (
+            host TEXT NOT NULL,
+            url TEXT NOT NULL,
+            title TEXT NOT NULL,
+            location TEXT NOT NULL,
+            rooms REAL NOT NULL,
+            rent REAL NOT NULL,
+            time TEXT NOT NULL,
+            PRIMARY KEY (host, url)
+        );
+        CREATE INDEX IF NOT EXISTS ads_url ON ads (url);
+        CREATE INDEX IF NOT EXISTS ads_time ON ads (time);
+        CREATE TABLE IF NOT EXISTS companies (
+            host TEXT PRIMARY KEY,
+            update_time TEXT NOT NULL
+        );
+    """
+
+class _Field:
+    """Compiled field of the form ``path:pattern``."""
+
+    def __init__(self, field: str) -> None:
+        path, sep, pattern = field.partition(':')
+        self.xml_path = XMLPath(path)
+        self.json_path = JSONPath(path)
+        self.pattern = None
+        if sep and pattern:
+            try:
+                self.pattern = re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f'Bad pattern {pattern}') from e
+
+    def search(self, text: str) -> str:
+        """Search *text* for the pattern.
+
+        If there is no match, a :exc:`LookupError` is raised.
+        """
+        if not self.pattern:
+            return text
+        match = self.pattern.search(text)
+        if not match:
+            raise LookupError(f'No {self.pattern.pattern} in {text}')
+        return match[0]
+
+class _ExtractionPlan:
+    """Compiled paths and fields of a *company*, to query ads efficiently."""
+
+    def __init__(self, company: Company) -> None:
+        self.ad_xml_path = XMLPath(company.ad_path)
+        self.ad_json_path = JSONPath(company.ad_path)
+        self.url = _Field(company.url_path)
+        self.title = _Field(company.title_path)
+        self.location = _Field(company.location_path)
+        self.rooms = _Field(company.rooms_path)
+        self.rent = _Field(company.rent_field)
+
+@dataclass
+class UpdateMetrics:
+    """Metrics of the update of a real estate company.
+
+    .. attribute:: host
+
+       Hostname of the company.
+
+    .. attribute:: timings
+
+       Time in seconds spent per phase, i.e. ``fetch``, ``parse``, ``extract`` and ``store``.
+
+    .. attribute:: cache
+
+       Use of the cached company document. ``hit`` if it was still fresh, ``revalidated`` if it was
+       not modified, ``miss`` if it was fetched and ``error`` if the company could not be reached.
+
+    .. attribute:: fetched_bytes
+
+       Number of bytes fetched, as transferred, e.g. compressed.
+
+    .. attribute:: added_ads
+
+       Number of new ads.
+
+    .. attribute:: removed_ads
+
+       Number of ads which are no longer available.
+
+    .. attribute:: changed
+
+       Indicates if any ads were added, removed or modified. Their order does not matter.
+
+    .. attribute:: ok
+
+       Indicates if the update was successful.
+    """
+
+    host: str
+    timings: dict[str, float] = dataclasses.field(default_factory=dict)
+    cache: str = 'hit'
+    fetched_bytes: int = 0
+    added_ads: int = 0
+    removed_ads: int = 0
+    changed: bool = False
+    ok: bool = True
+
+    @contextmanager
+    def measure(self, phase: str) -> Iterator[None]:
+        """Context manager measuring the time spent in *phase*."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0) + perf_counter() - start
+
 class Company:
     """Real estate company.
 
+    The company document is refreshed adaptively, more often if the ads changed since the last
+    refresh and less often otherwise, between :attr:`min_refresh_interval` and
+    :attr:`max_refresh_interval`. The interval is prolonged by a random :attr:`refresh_jitter`, to
+    spread out the refreshes of different companies.
+
     .. attribute:: url
 
        URL of the document containing currently available flats of the company.
@@ -131,22 +650,80 @@ class Company:
 
        Term that the location of a flat needs to contain to be included.
 
+    .. attribute:: fetch_timeout
+
+       Time in seconds after which fetching the document is aborted if the company does not
+       respond, i.e. while connecting or waiting for data.
+
+    .. attribute:: html_parser
+
+       Parser for HTML documents, either ``html5lib`` or the faster, but less conforming ``lxml``.
+       If lxml is not available or fails to parse a document, html5lib is used.
+
+    .. attribute:: min_refresh_interval
+
+       Minimum time in seconds after which the document is refreshed.
+
+    .. attribute:: max_refresh_interval
+
+       Maximum time in seconds after which the document is refreshed.
+
+    .. attribute:: refresh_jitter
+
+       Maximum random prolongation of the refresh interval, as ratio.
+
+    .. attribute:: http_client
+
+       HTTP client to fetch the document with, if any. By default, the client of the
+       :attr:`directory` is used.
+
+    .. attribute:: metrics
+
+       Metrics of the last update.
+
     .. attribute:: TIMEOUT
 
-       Time since the last successful update after which the company is considered unavailable.
+       Time since a due refresh, without a successful update, after which the company is considered
+       unavailable.
+
+    .. attribute:: RETRY_INTERVAL
+
+       Time after the first of consecutive communication failures before the company is updated
+       again. It doubles with each further failure.
+
+    .. attribute:: MAX_RETRY_INTERVAL
+
+       Maximum time after a communication failure before the company is updated again.
     """
 
-    TIMEOUT: ClassVar[timedelta] = timedelta(hours=1, minutes=30)
+    TIMEOUT: ClassVar[timedelta] = timedelta(hours=1)
+    RETRY_INTERVAL: ClassVar[timedelta] = timedelta(minutes=5)
+    MAX_RETRY_INTERVAL: ClassVar[timedelta] = timedelta(hours=6)
 
-    _CACHE_TTL: ClassVar[timedelta] = timedelta(minutes=30)
+    _REFRESH_INCREASE: ClassVar[float] = 1.5
+    _REFRESH_DECREASE: ClassVar[float] = 0.5
 
     def __init__(
         self, url: str, ad_path: str, url_path: str, title_path: str, location_path: str,
-        rooms_path: str, rent_field: str, *, rooms_optional: bool = False, location_filter: str = ''
+        rooms_path: str, rent_field: str, *, rooms_optional: bool = False,
+        location_filter: str = '', fetch_timeout: float = 30, html_parser: str = 'html5lib',
+        min_refresh_interval: float = 1800, max_refresh_interval: float = 21600,
+        refresh_jitter: float = 0.1, http_client: HTTPClient | None = None
     ) -> None:
         components = urlsplit(url)
         if not (components.scheme and components.hostname):
             raise ValueError(f'Relative url {url}')
+        if fetch_timeout <= 0:
+            raise ValueError(f'Non-positive fetch_timeout {fetch_timeout}')
+        if html_parser not in {'html5lib', 'lxml'}:
+            raise ValueError(f'Unknown html_parser {html_parser}')
+        if min_refresh_interval <= 0:
+            raise ValueError(f'Non-positive min_refresh_interval {min_refresh_interval}')
+        if max_refresh_interval < min_refresh_interval:
+            raise ValueError(
+                f'max_refresh_interval {max_refresh_interval} below min_refresh_interval')
+        if refresh_jitter < 0:
+            raise ValueError(f'Negative refresh_jitter {refresh_jitter}')
         self.url = url
         self.host = components.hostname
         self.ad_path = ad_path
@@ -157,9 +734,23 @@ class Company:
         self.rent_field = rent_field
         self.rooms_optional = rooms_optional
         self.location_filter = location_filter
+        self.fetch_timeout = fetch_timeout
+        self.html_parser = html_parser
+        if self.html_parser == 'lxml' and not find_spec('lxml'):
+            getLogger(__name__).warning('Failed to find lxml for %s, falling back to html5lib',
+                                        self.host)
+            self.html_parser = 'html5lib'
+        self.min_refresh_interval = min_refresh_interval
+        self.max_refresh_interval = max_refresh_interval
+        self.refresh_jitter = refresh_jitter
+        self.http_client = http_client
+        self._plan = _ExtractionPlan(self)
+        self._spec = (self.url, self.ad_path, self.url_path, self.title_path, self.location_path,
+                      self.rooms_path, self.rent_field, self.rooms_optional, self.html_parser)
+        self.metrics = UpdateMetrics(self.host)
 
         self._directory: Directory | None = None
-        self._ads_path = Path()
+        self._state_path = Path()
 
     @property
     def directory(self) -> Directory:
@@ -173,151 +764,263 @@ class Company:
         if self._directory:
             raise ValueError('Already set directory')
         self._directory = value
-        self._ads_path = self._directory.data_path / f'{self.host}.csv'
+        self._state_path = self._directory.data_path / f'{self.host}.state.json'
 
     def is_ok(self) -> bool:
         """Indicate if the company is available at the moment."""
-        try:
-            return (self.directory.now() - datetime.fromtimestamp(self._ads_path.stat().st_mtime)
-                    < Company.TIMEOUT)
-        except FileNotFoundError:
-            return False
+        update_time = self.directory.store.get_update_time(self.host)
+        return bool(
+            update_time and
+            self.directory.now() - update_time <
+            self._get_refresh_delay(self._read_state()) + Company.TIMEOUT)
 
     def get_ads(self) -> list[Ad]:
         """Get currently available flats."""
-        try:
-            with self._ads_path.open(encoding='utf-8') as f:
-                return [
-                    Ad(
-                        row['url'],
-                        row['title'],
-                        row['location'],
-                        float(row['rooms']),
-                        # Update rent (0.6)
-                        float(row.get('rent', '0')),
-                        datetime.fromisoformat(row['time'])
-                    )
-                    for row in cast(Iterable[dict[str, str]], csv.DictReader(f))]
-        except FileNotFoundError:
-            return []
+        return self.directory.store.get_ads(self.host)
+
+    def get_next_update_time(self) -> datetime:
+        """Get the time when the cached company document expires and an update is due."""
+        _, cache_time = self._get_cache()
+        time = (cache_time + self._get_refresh_delay(self._read_state()) if cache_time
+                else self.directory.now())
+        retry_time = self.get_retry_time()
+        return max(time, retry_time) if retry_time else time
+
+    def get_retry_time(self) -> datetime | None:
+        """Get the time before which the company should not be updated after communication
+        failures, if any.
+        """
+        retry_time = self._read_state().get('retry_time')
+        return datetime.fromtimestamp(retry_time) if isinstance(retry_time, (int, float)) else None
 
     def update(self) -> list[Ad]:
-        """Update current ads."""
-        old_ads = {ad.url: ad for ad in self.get_ads()}
-        ads = [dataclasses.replace(ad, time=old_ads.get(ad.url, ad).time) for ad in self.query()]
-
-        with self._ads_path.open('w', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, ['url', 'title', 'location', 'rooms', 'rent', 'time'])
-            writer.writeheader()
-            for ad in ads:
-                row = {
-                    'url': ad.url,
-                    'title': ad.title,
-                    'location': ad.location,
-                    'rooms': ad.rooms,
-                    'rent': ad.rent,
-                    'time': ad.time.isoformat()
-                }
-                writer.writerow(row)
+        """Update current ads.
+
+        If neither the company document nor the company configuration changed since the last
+        update, the stored ads are kept without parsing the document again.
+
+        If the document was refreshed, the refresh interval is adapted to whether the ads changed.
+        Changes are reported in :attr:`metrics`.
 
+        Communication failures are recorded and back off further updates (see
+        :meth:`get_retry_time`).
+        """
+        store = self.directory.store
+        self.metrics = metrics = UpdateMetrics(self.host)
+        with metrics.measure('fetch'):
+            try:
+                path = self._fetch()
+            except URLError:
+                self._record_failure()
+                raise
+        data = path.read_bytes()
+        state = self._read_state()
+        # Only write the state if it changed
+        dirty = state.pop('failures', None) is not None
+        state.pop('retry_time', None)
+        fingerprint = self._fingerprint(path, data)
+        if state.get('fingerprint') == fingerprint and store.get_update_time(self.host):
+            with metrics.measure('store'):
+                store.touch(self.host)
+                ads = store.get_ads(self.host)
+        else:
+            ads = self._parse(path, data)
+            with metrics.measure('store'):
+                old_ads = store.get_ads(self.host)
+                ads = store.put_ads(self.host, ads, old_ads=old_ads)
+            # The order of ads may differ between the document and the store
+            old_ads_by_url = {ad.url: ad for ad in old_ads}
+            ads_by_url = {ad.url: ad for ad in ads}
+            metrics.added_ads = len(ads_by_url.keys() - old_ads_by_url.keys())
+            metrics.removed_ads = len(old_ads_by_url.keys() - ads_by_url.keys())
+            metrics.changed = ads_by_url != old_ads_by_url
+            state['fingerprint'] = fingerprint
+            dirty = True
+
+        if metrics.cache != 'hit':
+            self._adapt_refresh_interval(state, metrics.changed)
+            dirty = True
+        if dirty:
+            self._write_state(state)
         return ads
 
     def query(self) -> list[Ad]:
         """Query current ads.
 
-        Numbers are parsed according to the current locale.
+        Numbers are parsed according to the :attr:`Directory.number_parser`.
+
+        The company document is cached. Once expired, it is revalidated with the company via ETag or
+        Last-Modified, if supported.
 
         If there is a problem communicating with the company, a :exc:`urllib.error.URLError` is
         raised. If there is a problem parsing the ads, a :exc:`LookupError` or :exc:`ValueError` is
         raised.
         """
+        self.metrics = metrics = UpdateMetrics(self.host)
+        with metrics.measure('fetch'):
+            path = self._fetch()
+        return self._parse(path, path.read_bytes())
+
+    def _get_cache(self) -> tuple[Path, datetime | None]:
+        # Return the path and time of the cached document, if any
         paths = [self.directory.data_path / f'{self.host}.html',
                  self.directory.data_path / f'{self.host}.json']
         for path in paths:
             try:
-                cache_time = datetime.fromtimestamp(path.stat().st_mtime)
-                break
+                return path, datetime.fromtimestamp(path.stat().st_mtime)
             except FileNotFoundError:
                 pass
-        else:
-            cache_time = None
-
-        if not cache_time or self.directory.now() - cache_time > self._CACHE_TTL:
-            with cast(addinfourl, urlopen(self.url)) as response:
-                content_type = response.headers.get_content_type()
-                data = response.read()
+        return path, None
+
+    def _fetch(self) -> Path:
+        path, cache_time = self._get_cache()
+        state = self._read_state()
+        if not cache_time or self.directory.now() - cache_time >= self._get_refresh_delay(state):
+            headers: dict[str, str] = {}
+            # Revalidate the cached document instead of downloading it again, if possible
+            if cache_time:
+                etag = state.get('etag')
+                if isinstance(etag, str):
+                    headers['If-None-Match'] = etag
+                last_modified = state.get('last_modified')
+                if isinstance(last_modified, str):
+                    headers['If-Modified-Since'] = last_modified
+
+            client = self.http_client or self.directory.http_client
+            response: HTTPResponse | None
+            self.metrics.cache = 'error'
             try:
-                ext = {'text/html': '.html', 'application/json': '.json'}[content_type]
-            except KeyError:
-                raise ValueError(f'Unknown document type {content_type}') from None
-            path = self.directory.data_path / f'{self.host}{ext}'
-            path.write_bytes(data)
-            getLogger(__name__).debug('Fetched %s', self.url)
-
-        parse = {'.html': self._parse_html, '.json': self._parse_json}[path.suffix]
-        ads = parse(path.read_bytes())
+                response = client.get(self.url, headers, timeout=self.fetch_timeout)
+            except HTTPError as e:
+                if not (cache_time and e.code == HTTPStatus.NOT_MODIFIED):
+                    raise
+                e.close()
+                response = None
+
+            if response is None:
+                path.touch()
+                self.metrics.cache = 'revalidated'
+                getLogger(__name__).debug('Revalidated %s', self.url)
+            else:
+                self.metrics.cache = 'miss'
+                self.metrics.fetched_bytes = response.size
+                content_type = response.headers.get_content_type()
+                try:
+                    ext = {'text/html': '.html', 'application/json': '.json'}[content_type]
+                except KeyError:
+                    raise ValueError(f'Unknown document type {content_type}') from None
+                path = self.directory.data_path / f'{self.host}{ext}'
+                self.directory.writer.write_bytes(path, response.data)
+                state.update({'etag': response.headers.get('ETag'),
+                              'last_modified': response.headers.get('Last-Modified')})
+                self._write_state(state)
+                getLogger(__name__).debug('Fetched %s', self.url)
+        return path
+
+    def _parse(self, path: Path, data: bytes) -> list[Ad]:
+        pool = self.directory.process_pool
+        if pool:
+            # Transfer only the document and the company specification to the worker and get back
+            # compact rows
+            rows, timings = pool.submit(_parse_in_worker, self._spec, self.directory.number_parser,
+                                        path.suffix, data).result()
+            for phase, seconds in timings.items():
+                self.metrics.timings[phase] = self.metrics.timings.get(phase, 0) + seconds
+            now = self.directory.now()
+            ads = [Ad.from_store(*row, now) for row in rows]
+        else:
+            ads = self._parse_document(path.suffix, data)
         if self.location_filter:
             ads = [ad for ad in ads if self.location_filter in ad.location]
         ads = [ad for ad in ads if ad.rooms]
         return ads
 
+    def _parse_document(self, suffix: str, data: bytes) -> list[Ad]:
+        parse = {'.html': self._parse_html, '.json': self._parse_json}[suffix]
+        return parse(data)
+
     def _parse_html(self, data: bytes) -> list[Ad]:
-        def query(element: Element, field: str, *, optional: bool = False) -> str:
-            path, pattern = self._parse_field(field)
+        def query(element: Element, field: _Field, *, optional: bool = False) -> str:
             try:
                 try:
-                    element = query_xml(element, path)[0]
+                    element = query_xml(element, field.xml_path)[0]
                 except IndexError:
                     # Serialize element without children
-                    element = Element(element.tag, attrib=element.attrib)
+                    element = Element(element.tag, attrib=dict(element.attrib))
                     xml = ElementTree.tostring(element, encoding='unicode')
-                    raise LookupError(f'No {path} in {xml}') from None
-                return self._query_pattern(''.join(element.itertext()), pattern)
+                    raise LookupError(f'No {field.xml_path} in {xml}') from None
+                return field.search(''.join(element.itertext()))
             except LookupError:
                 if optional:
                     return ''
                 raise
 
+        plan = self._plan
+        parse_number = self.directory.number_parser.parse
+        with self.metrics.measure('parse'):
+            tree = self._parse_html_tree(data)
+        with self.metrics.measure('extract'):
+            elements = query_xml(tree, plan.ad_xml_path)
+            return [
+                Ad(
+                    urljoin(self.url, query(element, plan.url)),
+                    query(element, plan.title).strip() or '?',
+                    query(element, plan.location).strip() or '?',
+                    parse_number(query(element, plan.rooms, optional=self.rooms_optional)),
+                    parse_number(query(element, plan.rent)), self.directory.now())
+                for element in elements]
+
+    def _parse_html_tree(self, data: bytes) -> Element:
+        # Parsers take a while to import, so only the configured one is loaded, on first use
+        # pylint: disable=import-outside-toplevel
+        if self.html_parser == 'lxml':
+            from lxml import etree, html
+            try:
+                # lxml elements implement the ElementTree API
+                return cast(Element, html.document_fromstring(data))
+            except etree.LxmlError as e: # type: ignore[misc]
+                getLogger(__name__).warning(
+                    'Failed to parse document of %s with lxml, falling back to html5lib (%s)',
+                    self.host, e)
+        import html5lib
         # Unfortunately strict parsing fails for most real-world companies
-        tree = html5lib.parse(data, namespaceHTMLElements=False)
-        elements = query_xml(tree, self.ad_path)
-        return [
-            Ad(
-                urljoin(self.url, query(element, self.url_path)),
-                query(element, self.title_path).strip() or '?',
-                query(element, self.location_path).strip() or '?',
-                self._fuzzy_float(query(element, self.rooms_path, optional=self.rooms_optional)),
-                self._fuzzy_float(query(element, self.rent_field)), self.directory.now())
-            for element in elements]
+        return html5lib.parse(data, namespaceHTMLElements=False)
 
     def _parse_json(self, data: bytes) -> list[Ad]:
+        with self.metrics.measure('parse'):
+            document = data.decode(json.detect_encoding(data), 'surrogatepass')
         try:
-            root = cast(object, json.loads(data))
+            if not re.match(r'\s*\{', document):
+                root = cast(object, json.loads(document))
+                raise ValueError(f'Bad document root type {type(root).__name__}')
+            # Parse incrementally, because some documents contain thousands of ads. Parsing and
+            # extraction are thus interleaved and measured together.
+            with self.metrics.measure('extract'):
+                return self._parse_json_ads(stream_json(document, self._plan.ad_json_path))
         except JSONDecodeError as e:
             raise ValueError(f'Bad document line {e.lineno}') from e
-        if not isinstance(root, dict):
-            raise ValueError(f'Bad document root type {type(root).__name__}')
+
+    def _parse_json_ads(self, values: Iterable[object]) -> list[Ad]:
 
         @overload
-        def query(value: object, field: str, cls: type[_T], *, optional: bool = False) -> _T:
+        def query(value: object, field: _Field, cls: type[_T], *, optional: bool = False) -> _T:
             pass
         @overload
         def query(
-            value: object, field: str, cls: tuple[type[_T], type[_U], type[_V]], *,
+            value: object, field: _Field, cls: tuple[type[_T], type[_U], type[_V]], *,
             optional: bool = False
         ) -> _T | _U | _V:
             pass
         def query(
-            value: object, field: str, cls: type[_T] | tuple[type[_T], type[_U], type[_V]], *,
+            value: object, field: _Field, cls: type[_T] | tuple[type[_T], type[_U], type[_V]], *,
             optional: bool = False
         ) -> _T | _U | _V:
-            path, pattern = self._parse_field(field)
             try:
-                value = query_json(value, path, cls)[0]
-                if pattern:
+                value = query_json(value, field.json_path, cls)[0]
+                if field.pattern:
                     if not isinstance(value, str):
-                        raise LookupError(f'No {pattern} in {value}')
-                    value = self._query_pattern(value, pattern)
+                        raise LookupError(f'No {field.pattern.pattern} in {value}')
+                    value = field.search(value)
                 return cast('_T | _U | _V', value)
             except LookupError:
                 if optional:
@@ -326,52 +1029,84 @@ class Company:
                     return value
                 raise
 
-        values = cast(list[dict[str, object]], query_json(root, self.ad_path, dict))
+        plan = self._plan
+        parse_number = self.directory.number_parser.parse
+        def check(value: object) -> dict[str, object]:
+            if not isinstance(value, dict):
+                raise ValueError(f'Bad item type {type(value).__name__} at {plan.ad_json_path}')
+            return cast(dict[str, object], value)
+
         return [
             Ad(
-                urljoin(self.url, query(value, self.url_path, str)),
-                query(value, self.title_path, str).strip() or '?',
-                query(value, self.location_path, str).strip() or '?',
-                self._fuzzy_float(
-                    query(value, self.rooms_path, (str, int, float), optional=self.rooms_optional)),
-                self._fuzzy_float(query(value, self.rent_field, (str, int, float))),
+                urljoin(self.url, query(value, plan.url, str)),
+                query(value, plan.title, str).strip() or '?',
+                query(value, plan.location, str).strip() or '?',
+                parse_number(
+                    query(value, plan.rooms, (str, int, float), optional=self.rooms_optional)),
+                parse_number(query(value, plan.rent, (str, int, float))),
                 self.directory.now())
-            for value in values]
-
-    @staticmethod
-    def _parse_field(field: str) -> tuple[str, str | None]:
-        tokens = field.split(':', 1)
-        path = tokens[0]
+            for value in map(check, values)]
+
+    def _fingerprint(self, path: Path, data: bytes) -> str:
+        # Parsing may change between versions and with the number format of the locale
+        number_parser = self.directory.number_parser
+        config = [
+            VERSION, self.url, path.suffix, self.ad_path, self.url_path, self.title_path,
+            self.location_path, self.rooms_path, self.rent_field, self.rooms_optional,
+            self.location_filter, self.html_parser, number_parser.decimal_point,
+            number_parser.thousands_sep
+        ]
+        digest = sha256(json.dumps(config).encode())
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _get_refresh_delay(self, state: dict[str, object]) -> timedelta:
+        # Time after which the cached document expires, as scheduled at the last refresh
+        delay = state.get('refresh_delay')
+        if not isinstance(delay, (int, float)):
+            delay = self.min_refresh_interval
+        delay = min(max(delay, self.min_refresh_interval),
+                    self.max_refresh_interval * (1 + self.refresh_jitter))
+        return timedelta(seconds=delay)
+
+    def _adapt_refresh_interval(self, state: dict[str, object], changed: bool) -> None:
+        # Refresh more often if the ads changed since the last refresh and less often otherwise
+        interval = state.get('refresh_interval')
+        if not isinstance(interval, (int, float)):
+            interval = self.min_refresh_interval
+        interval *= self._REFRESH_DECREASE if changed else self._REFRESH_INCREASE
+        interval = min(max(interval, self.min_refresh_interval), self.max_refresh_interval)
+        state['refresh_interval'] = interval
+        state['refresh_delay'] = interval * (1 + uniform(0, self.refresh_jitter))
+
+    def _record_failure(self) -> None:
+        # Back off exponentially from a company with consecutive communication failures
+        state = self._read_state()
+        failures = state.get('failures')
+        failures = (failures if isinstance(failures, int) else 0) + 1
+        delay = min(self.RETRY_INTERVAL * (1 << min(failures - 1, 16)), self.MAX_RETRY_INTERVAL)
+        state['failures'] = failures
+        state['retry_time'] = (self.directory.now() + delay).timestamp()
+        self._write_state(state)
+
+    def _read_state(self) -> dict[str, object]:
         try:
-            pattern = tokens[1]
-        except IndexError:
-            pattern = None
-        return path, pattern
-
-    @staticmethod
-    def _query_pattern(text: str, pattern: str | None) -> str:
-        if not pattern:
-            return text
-        match = re.search(pattern, text)
-        if not match:
-            raise LookupError(f'No {pattern} in {text}')
-        return match[0]
+            state = cast(object, json.loads(self._state_path.read_bytes()))
+        except FileNotFoundError:
+            return {}
+        except JSONDecodeError:
+            getLogger(__name__).warning('Reset corrupt state of %s', self.host)
+            return {}
+        return cast(dict[str, object], state) if isinstance(state, dict) else {}
 
-    @staticmethod
-    def _fuzzy_float(value: str | int | float) -> float:
-        if isinstance(value, (int, float)):
-            return float(value)
-        conv = localeconv()
-        decimal = re.escape(conv['decimal_point'])
-        group = re.escape(conv['thousands_sep'])
-        # Simplified float() grammar
-        match = re.search(rf'\d[{group}\d]*({decimal}\d+)?', value)
-        return atof(match[0]) if match else .0
+    def _write_state(self, state: dict[str, object]) -> None:
+        self.directory.writer.write_text(self._state_path, json.dumps(state))
 
 class Directory:
     """Directory of available flats from different real estate companies.
 
-    :attr:`currency` is determined from the current locale.
+    :attr:`currency` and :attr:`number_parser` are determined from the given *locale*, by default
+    from the current locale.
 
     .. attribute:: companies
 
@@ -393,15 +1128,63 @@ class Directory:
 
        Sign of the currency in use.
 
+    .. attribute:: number_parser
+
+       Parser of numbers in company documents.
+
     .. attribute:: data_directory
 
        Path to data directory.
+
+    .. attribute:: concurrency
+
+       Maximum number of companies to update concurrently.
+
+    .. attribute:: parse_processes
+
+       Number of worker processes to parse company documents with. If ``0``, documents are parsed
+       in-process.
+
+    .. attribute:: http_client
+
+       HTTP client to fetch company documents with. A client may be shared by multiple directories.
+
+    .. attribute:: process_pool
+
+       Pool of worker processes to parse company documents with, if any. A pool may be shared by
+       multiple directories. By default, a pool with :attr:`parse_processes` workers is created
+       (see :func:`create_process_pool`).
+
+    .. attribute:: store
+
+       Storage of the ads of :attr:`companies`.
+
+    .. attribute:: writer
+
+       Writer for files in the data directory.
+
+    .. attribute:: update_hooks
+
+       Functions called with the :class:`UpdateMetrics` of each updated company.
+
+    .. attribute:: render_time
+
+       Time in seconds the last generation of the web directory took, if any.
+
+    .. attribute:: DUPLICATE_SIMILARITY
+
+       Minimum similarity of the titles of ads of the same flat, as ratio of shared words.
     """
 
+    STORES: ClassVar[dict[str, type[AdStore]]] = {'csv': CSVAdStore, 'sqlite': SQLiteAdStore}
+    DUPLICATE_SIMILARITY: ClassVar[float] = 0.5
+
     def __init__(
         self, companies: Iterable[Company], *, title: str = 'Flat Directory',
         description: str = 'Currently available flats from {companies} real estate companies.',
-        extra: str | None = None, data_path: PathLike[str] | str = 'data'
+        extra: str | None = None, data_path: PathLike[str] | str = 'data', concurrency: int = 4,
+        store: str = 'csv', parse_processes: int = 0, locale: str | None = None,
+        process_pool: ProcessPoolExecutor | None = None, http_client: HTTPClient | None = None
     ) -> None:
         self.title = title.strip()
         if not self.title:
@@ -410,30 +1193,223 @@ class Directory:
         if not self.description:
             raise ValueError('Blank description')
         self.extra = (extra.strip() or None) if extra else None
-        self.currency = localeconv()['currency_symbol'] or '¤'
+        try:
+            with use_locale(locale) if locale else nullcontext():
+                self.currency = localeconv()['currency_symbol'] or '¤'
+                self.number_parser = NumberParser.from_locale()
+        except LocaleError:
+            raise ValueError(f'Unknown locale {locale}') from None
 
         self.data_path = Path(data_path)
+        if concurrency < 1:
+            raise ValueError(f'Non-positive concurrency {concurrency}')
+        self.concurrency = concurrency
+        if parse_processes < 0:
+            raise ValueError(f'Negative parse_processes {parse_processes}')
+        self.parse_processes = parse_processes
+        self.process_pool = process_pool
+        if self.parse_processes and not self.process_pool:
+            self.process_pool = create_process_pool(self.parse_processes)
+        self.http_client = http_client or HTTPClient(user_agent=f'flatdir/{VERSION}')
+        self.writer = AtomicWriter()
+        try:
+            self.store = self.STORES[store](self.data_path, writer=self.writer)
+        except KeyError:
+            raise ValueError(f'Unknown store {store}') from None
 
         self.companies = list(companies)
         for company in self.companies:
             company.directory = self
+        self.update_hooks: list[Callable[[UpdateMetrics], None]] = []
+        self.render_time: float | None = None
+        self._updated_companies: set[Company] = set()
+        self._table: AdTable | None = None
 
     def get_ads(self) -> list[Ad]:
         """Get currently available flats."""
         return [ad for company in self.companies for ad in company.get_ads()]
 
-    def update(self) -> None:
-        """Aggregate current ads from all :attr:`companies`."""
+    def get_table(self) -> AdTable:
+        """Get currently available flats as table, for efficient filtering.
+
+        The table is built on first use and kept until an :meth:`update` changes any ads.
+        """
+        if self._table is None:
+            self._table = AdTable(self.get_ads())
+        return self._table
+
+    def get_ad_groups(self) -> list[AdGroup]:
+        """Get currently available flats, grouping duplicate ads from different companies.
+
+        Ads are considered duplicates if they have the same location, number of rooms and rent and
+        their titles have a similarity of at least :attr:`DUPLICATE_SIMILARITY`. Groups are ordered
+        by publication time, the oldest first.
+        """
+        def time_key(ad: Ad) -> datetime:
+            return ad.time
+        def normalize(text: str) -> list[str]:
+            return cast(list[str], re.findall(r'\w+', text.casefold()))
+
+        # Only ads in the same bucket are compared, so grouping stays close to linear
+        buckets: dict[tuple[str, float, int], list[tuple[frozenset[str], AdGroup]]] = {}
+        groups = []
+        for ad in sorted(self.get_ads(), key=time_key):
+            words = frozenset(normalize(ad.title))
+            key = (' '.join(normalize(ad.location)), ad.rooms, round(ad.rent))
+            bucket = buckets.setdefault(key, [])
+            for group_words, group in bucket:
+                if (ad.host not in group.hosts and
+                        len(words & group_words) >=
+                        self.DUPLICATE_SIMILARITY * len(words | group_words)):
+                    group.ads.append(ad)
+                    break
+            else:
+                group = AdGroup([ad])
+                bucket.append((words, group))
+                groups.append(group)
+        return groups
+
+    def update(self, companies: Iterable[Company] | None = None) -> list[Company]:
+        """Aggregate current ads from *companies*, by default from all :attr:`companies`.
+
+        Up to :attr:`concurrency` companies are updated at the same time. The directories of all
+        files written during the update are synced to disk together at the end.
+
+        Companies backing off after communication failures are skipped until their
+        :meth:`Company.get_retry_time`, keeping their last stored ads.
+
+        Companies whose ads changed are returned. Afterwards, the :attr:`update_hooks` are called
+        and the metrics are written with :meth:`write_metrics`.
+        """
         logger = getLogger(__name__)
-        for company in self.companies:
+
+        def update(company: Company) -> bool:
             try:
                 ads = company.update()
                 logger.info('Updated %d ad(s) from %s', len(ads), company.host)
             except URLError as e:
+                company.metrics.ok = False
                 logger.error('Failed to communicate with %s (%s)', company.host, e.reason)
+                return False
             except (LookupError, ValueError, SyntaxError) as e:
+                company.metrics.ok = False
                 logger.error('Failed to parse flat ads from %s (%s)', company.host, e)
+                return False
+            return company.metrics.changed
+
+        now = self.now()
+        due = []
+        for company in self.companies if companies is None else companies:
+            retry_time = company.get_retry_time()
+            if retry_time and retry_time > now:
+                logger.info('Skipped %s until %s after communication failures', company.host,
+                            retry_time.isoformat(timespec='seconds'))
+            else:
+                due.append(company)
+        companies = due
+        with self.writer.batch():
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                # Data directory errors are passed through
+                changes = list(executor.map(update, companies))
+            self._updated_companies.update(companies)
+            for company in companies:
+                for hook in self.update_hooks:
+                    hook(company.metrics)
+            self.write_metrics()
+        changed = [company for company, company_changed in zip(companies, changes)
+                   if company_changed]
+        if changed:
+            self._table = None
+        return changed
+
+    def write_metrics(self) -> None:
+        """Write the metrics of the last update of each company and of :attr:`render_time` to
+        :file:`metrics.prom` in the Prometheus text format.
+
+        See https://prometheus.io/docs/instrumenting/exposition_formats/.
+        """
+        label_escapes = str.maketrans({'\\': r'\\', '"': r'\"', '\n': r'\n'})
+
+        def metric(name: str, description: str,
+                   samples: Iterable[tuple[dict[str, str], float]]) -> str:
+            lines = [f'# HELP flatdir_{name} {description}', f'# TYPE flatdir_{name} gauge']
+            for labels, value in samples:
+                label_list = ','.join(
+                    f'{key}="{label.translate(label_escapes)}"' for key, label in labels.items())
+                lines.append(f'flatdir_{name}{{{label_list}}} {value:g}' if label_list
+                             else f'flatdir_{name} {value:g}')
+            return '\n'.join(lines)
+
+        metrics = [company.metrics for company in self.companies
+                   if company in self._updated_companies]
+        text = [
+            metric('update_phase_seconds',
+                   'Time spent per phase in the last update of a company.',
+                   (({'host': m.host, 'phase': phase}, seconds)
+                    for m in metrics for phase, seconds in m.timings.items())),
+            metric('update_ok', 'Indicates if the last update of a company was successful.',
+                   (({'host': m.host}, m.ok) for m in metrics)),
+            metric('document_cache', 'Use of the cached document in the last update of a company.',
+                   (({'host': m.host, 'result': result}, m.cache == result)
+                    for m in metrics for result in ('hit', 'revalidated', 'miss', 'error'))),
+            metric('fetched_bytes', 'Number of bytes fetched in the last update of a company.',
+                   (({'host': m.host}, m.fetched_bytes) for m in metrics)),
+            metric('added_ads', 'Number of new ads in the last update of a company.',
+                   (({'host': m.host}, m.added_ads) for m in metrics)),
+            metric('removed_ads', 'Number of removed ads in the last update of a company.',
+                   (({'host': m.host}, m.removed_ads) for m in metrics))
+        ]
+        if self.render_time is not None:
+            text.append(metric('render_seconds',
+                               'Time spent in the last generation of the web directory.',
+                               [({}, self.render_time)]))
+        self.writer.write_text(self.data_path / 'metrics.prom', '\n'.join(text) + '\n')
 
     def now(self) -> datetime:
         """Return the current local date and time."""
         return datetime.now()
+
+def create_process_pool(max_workers: int, *,
+                        mp_context: BaseContext | None = None) -> ProcessPoolExecutor:
+    """Create a pool of *max_workers* worker processes to parse company documents with.
+
+    The workers are started right away, before any update threads, so forking them is safe. They
+    ignore SIGINT, so that an interrupt is handled by the main process alone. *mp_context* is the
+    multiprocessing context to start them with.
+    """
+    # multiprocessing is only loaded if documents are parsed in worker processes
+    # pylint: disable=import-outside-toplevel
+    from concurrent.futures import ProcessPoolExecutor
+    process_pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context,
+                                       initializer=_init_worker)
+    process_pool.submit(int)
+    return process_pool
+
+def _init_worker() -> None:
+    # Leave handling an interrupt, e.g. on Ctrl+C, to the main process, which shuts down the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+_worker_companies: dict[tuple[str, str, str, str, str, str, str, bool, str], Company] = {}
+
+def _parse_in_worker(
+    spec: tuple[str, str, str, str, str, str, str, bool, str], number_parser: NumberParser,
+    suffix: str, data: bytes
+) -> tuple[list[tuple[str, str, str, str, float, float]], dict[str, float]]:
+    # Parse the document of the company with the given specification in a worker process and return
+    # the ads as rows along with the timings
+    # pylint: disable=protected-access
+    try:
+        company = _worker_companies[spec]
+    except KeyError:
+        url, ad_path, url_path, title_path, location_path, rooms_path, rent_field, rooms_optional, \
+            html_parser = spec
+        company = Company(url, ad_path, url_path, title_path, location_path, rooms_path,
+                          rent_field, rooms_optional=rooms_optional, html_parser=html_parser)
+        Directory([company])
+        _worker_companies[spec] = company
+    # The locale of the worker may differ, so use the number parser of the directory
+    company.directory.number_parser = number_parser
+    company.metrics = UpdateMetrics(company.host)
+    ads = company._parse_document(suffix, data)
+    return ([(ad.host, ad.url, ad.title, ad.location, ad.rooms, ad.rent) for ad in ads],
+            company.metrics.timings)
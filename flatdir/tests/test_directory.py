@@ -1,19 +1,27 @@
 # pylint: disable=missing-docstring
 
+from concurrent.futures import ProcessPoolExecutor
+from signal import SIGINT, SIG_IGN, getsignal
 from datetime import datetime, timedelta
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 from importlib import resources
 import logging
+from multiprocessing import get_context
+import os
 from pathlib import Path
 from socket import socket
 from socketserver import BaseServer
+import sys
 from tempfile import TemporaryDirectory
 from threading import Thread
-from typing import ClassVar
+from typing import ClassVar, cast
 import unittest
+from urllib.error import URLError
 from urllib.parse import urljoin
 
-from flatdir.directory import Ad, Company, Directory
+from flatdir.directory import (Ad, AdTable, CSVAdStore, Company, Directory, SQLiteAdStore,
+                               UpdateMetrics, create_process_pool)
+from flatdir.util import NumberParser
 
 class TestCase(unittest.TestCase):
     class _RequestHandler(SimpleHTTPRequestHandler):
@@ -60,9 +68,65 @@ class TestCase(unittest.TestCase):
     def assertEqual(self, first: object, second: object, msg: object = None) -> None:
         super().assertEqual(first, second, msg=msg)
 
+class AdTest(unittest.TestCase):
+    def test_init(self) -> None:
+        ad = Ad('https://example.org/1', ' Flat 1 ', ''.join(['Mit', 'te ']), 2, 1000,
+                datetime(2023, 2, 3, 20))
+        self.assertEqual(ad.host, 'example.org')
+        self.assertEqual(ad.title, 'Flat 1')
+        self.assertIs(ad.location, sys.intern('Mitte'))
+
+    def test_init_bad_url(self) -> None:
+        with self.assertRaises(ValueError):
+            Ad('/1', 'Flat 1', 'Mitte', 2, 1000, datetime(2023, 2, 3, 20))
+
+    def test_from_store(self) -> None:
+        time = datetime(2023, 2, 3, 20)
+        ad = Ad.from_store('example.org', 'https://example.org/1', 'Flat 1', 'Mitte', 2, 1000, time)
+        self.assertEqual(ad, Ad('https://example.org/1', 'Flat 1', 'Mitte', 2, 1000, time))
+        self.assertEqual(ad.host, 'example.org')
+
+class AdTableTest(unittest.TestCase):
+    NOW = datetime(2023, 2, 3, 20)
+
+    def setUp(self) -> None:
+        rows: list[tuple[str, str, float, float]] = [
+            ('example.org', 'Berlin-Mitte', 1, 500),
+            ('example.com', 'Kreuzberg', 3, 1500),
+            ('example.org', 'Mitte', 2, 1000),
+            ('example.com', 'Berlin-Mitte', 4, 2000)
+        ]
+        self.ads = [Ad(f'https://{host}/{i}', f'Flat {i}', location, rooms, rent,
+                       self.NOW + timedelta(hours=i))
+                    for i, (host, location, rooms, rent) in enumerate(rows)]
+        self.table = AdTable(self.ads)
+
+    def test_iter(self) -> None:
+        self.assertEqual(list(self.table), list(reversed(self.ads))) # type: ignore[misc]
+        self.assertEqual(self.table.hosts, ['example.com', 'example.org']) # type: ignore[misc]
+
+    def test_getitem_slice(self) -> None:
+        self.assertEqual(list(self.table[1:3]), [self.ads[2], self.ads[1]]) # type: ignore[misc]
+
+    def test_filter(self) -> None:
+        table = self.table.filter(min_rent=1000, max_rent=2000, min_rooms=3, location='Mitte')
+        self.assertEqual(list(table), [self.ads[3]]) # type: ignore[misc]
+
+    def test_filter_view(self) -> None:
+        table = self.table.filter(location='Mitte').filter(host='example.org')
+        self.assertEqual(list(table), [self.ads[2], self.ads[0]]) # type: ignore[misc]
+
+    def test_filter_no_match(self) -> None:
+        self.assertEqual(list(self.table.filter(host='example.net')), []) # type: ignore[misc]
+
 class CompanyTest(TestCase):
     NOW = datetime(2023, 2, 3, 20)
 
+    def test_init_bad_pattern(self) -> None:
+        with self.assertRaisesRegex(ValueError, 'pattern'):
+            Company(f'http://localhost:{self.PORT}/index.html', ".//li[@class='ad']", 'a/@href',
+                    'a', 'span[1]:[', 'span[2]', 'span[3]')
+
     def test_update(self) -> None:
         company = Company(f'http://localhost:{self.PORT}/index.html', ".//li[@class='ad']",
                           'a/@href', 'a', 'span[1]:[^,]*', 'span[2]', 'span[3]')
@@ -86,6 +150,81 @@ class CompanyTest(TestCase):
         ads = company.get_ads()
         self.assertEqual(ads, self.expected_ads(company.url, self.NOW))
 
+    def test_get_next_update_time(self) -> None:
+        company = Company(f'http://localhost:{self.PORT}/index.html', ".//li[@class='ad']",
+                          'a/@href', 'a', 'span[1]:[^,]*', 'span[2]', 'span[3]')
+        Directory([company], data_path=self.data_path)
+        company.update()
+        time = company.get_next_update_time()
+        self.assertGreater(time, datetime.now() + timedelta(minutes=29))
+
+    def test_update_unchanged_ads(self) -> None:
+        company = Company(f'http://localhost:{self.PORT}/index.html', ".//li[@class='ad']",
+                          'a/@href', 'a', 'span[1]:[^,]*', 'span[2]', 'span[3]',
+                          min_refresh_interval=60, refresh_jitter=0)
+        Directory([company], data_path=self.data_path)
+        company.update()
+        path = self.data_path / 'localhost.html'
+        cache_time = (datetime.now() - timedelta(minutes=1)).timestamp()
+        os.utime(path, (cache_time, cache_time))
+
+        company.update()
+        cache_time = path.stat().st_mtime
+        self.assertEqual(company.get_next_update_time(),
+                         datetime.fromtimestamp(cache_time) + timedelta(seconds=90))
+
+    def test_update_unchanged_document(self) -> None:
+        company = Company(f'http://localhost:{self.PORT}/index.html', ".//li[@class='ad']",
+                          'a/@href', 'a', 'span[1]:[^,]*', 'span[2]', 'span[3]')
+        directory = Directory([company], data_path=self.data_path)
+        directory.now = lambda: self.NOW # type: ignore[method-assign]
+        company.update()
+        def parse_html(data: bytes) -> list[Ad]:
+            raise AssertionError()
+        company._parse_html = parse_html # type: ignore[method-assign]
+
+        ads = company.update()
+        self.assertEqual(ads, self.expected_ads(company.url, self.NOW))
+
+    def test_update_reordered_ads(self) -> None:
+        company = Company(f'http://localhost:{self.PORT}/index.html', ".//li[@class='ad']",
+                          'a/@href', 'a', 'span[1]:[^,]*', 'span[2]', 'span[3]')
+        directory = Directory([company], data_path=self.data_path, store='sqlite')
+        directory.now = lambda: self.NOW # type: ignore[method-assign]
+        directory.store.put_ads('localhost',
+                                reversed(self.expected_ads(company.url, self.NOW)))
+
+        company.update()
+        self.assertFalse(company.metrics.changed)
+        self.assertEqual(company.metrics.added_ads, 0)
+
+    def test_update_changed_config(self) -> None:
+        company = Company(f'http://localhost:{self.PORT}/index.html', ".//li[@class='ad']",
+                          'a/@href', 'a', 'span[1]:[^,]*', 'span[2]', 'span[3]')
+        directory = Directory([company], data_path=self.data_path)
+        directory.now = lambda: self.NOW # type: ignore[method-assign]
+        company.update()
+        company.location_filter = 'e'
+        company.update()
+        def parse_html(data: bytes) -> list[Ad]:
+            raise AssertionError()
+        company._parse_html = parse_html # type: ignore[method-assign]
+
+        ads = company.update()
+        self.assertEqual(company.metrics.cache, 'hit')
+        self.assertEqual(ads, self.expected_ads(company.url, self.NOW))
+
+    def test_update_changed_number_format(self) -> None:
+        company = Company(f'http://localhost:{self.PORT}/index.html', ".//li[@class='ad']",
+                          'a/@href', 'a', 'span[1]:[^,]*', 'span[2]', 'span[3]')
+        directory = Directory([company], data_path=self.data_path)
+        directory.now = lambda: self.NOW # type: ignore[method-assign]
+        company.update()
+        directory.number_parser = NumberParser(decimal_point=',', thousands_sep='.')
+
+        ads = company.update()
+        self.assertEqual(ads[1].rent, 49999)
+
     def test_query(self) -> None:
         company = Company(f'http://localhost:{self.PORT}/index.html', ".//li[@class='ad']",
                           'a/@href', 'a', 'span[1]:[^,]*', 'span[2]', 'span[3]')
@@ -95,6 +234,20 @@ class CompanyTest(TestCase):
         ads = company.query()
         self.assertEqual(ads, self.expected_ads(company.url, self.NOW))
 
+    def test_query_process_pool(self) -> None:
+        company = Company(f'http://localhost:{self.PORT}/index.html', ".//li[@class='ad']",
+                          'a/@href', 'a', 'span[1]:[^,]*', 'span[2]', 'span[3]')
+        # Do not fork the running test server thread
+        process_pool = ProcessPoolExecutor(max_workers=1, mp_context=get_context('forkserver'))
+        self.addCleanup(process_pool.shutdown)
+        directory = Directory([company], data_path=self.data_path, parse_processes=1,
+                              process_pool=process_pool)
+        directory.now = lambda: self.NOW # type: ignore[method-assign]
+
+        ads = company.query()
+        self.assertEqual(ads, self.expected_ads(company.url, self.NOW))
+        self.assertIn('extract', company.metrics.timings)
+
     def test_query_json(self) -> None:
         company = Company(f'http://localhost:{self.PORT}/ads.json', 'ads.*', 'url', 'title',
                           'location:[^,]*', 'rooms', 'rent')
@@ -104,6 +257,43 @@ class CompanyTest(TestCase):
         ads = company.query()
         self.assertEqual(ads, self.expected_ads(company.url, self.NOW))
 
+    def test_query_lxml(self) -> None:
+        companies = [
+            Company(f'http://localhost:{self.PORT}/index.html', ".//li[@class='ad']", 'a/@href',
+                    'a', 'span[1]:[^,]*', 'span[2]', 'span[3]', html_parser=html_parser)
+            for html_parser in ['html5lib', 'lxml']
+        ]
+        directory = Directory(companies, data_path=self.data_path)
+        directory.now = lambda: self.NOW # type: ignore[method-assign]
+
+        ads = companies[1].query()
+        self.assertEqual(ads, companies[0].query())
+        self.assertEqual(ads, self.expected_ads(companies[1].url, self.NOW))
+
+    def test_query_lxml_bad_document(self) -> None:
+        company = Company(f'http://localhost:{self.PORT}/index.html', './/body', 'a/@href', 'a',
+                          'a', 'a', 'a', html_parser='lxml')
+        Directory([company], data_path=self.data_path)
+        with self.assertRaisesRegex(LookupError, 'a/@href'):
+            company._parse_html(b'')
+
+    def test_query_unmodified_document(self) -> None:
+        company = Company(f'http://localhost:{self.PORT}/index.html', ".//li[@class='ad']",
+                          'a/@href', 'a', 'span[1]:[^,]*', 'span[2]', 'span[3]')
+        directory = Directory([company], data_path=self.data_path)
+        directory.now = lambda: self.NOW # type: ignore[method-assign]
+        company.query()
+        # Tell the cached document apart from the original
+        path = self.data_path / 'localhost.html'
+        path.write_bytes(path.read_bytes().replace(b'Luxurious', b'Lavish'))
+        cache_time = (datetime.now() - timedelta(hours=1)).timestamp()
+        os.utime(path, (cache_time, cache_time))
+        directory.now = datetime.now # type: ignore[method-assign]
+
+        ads = company.query()
+        self.assertEqual(ads[0].title, 'Lavish Lodge')
+        self.assertGreater(path.stat().st_mtime, cache_time)
+
     def test_query_missing_element(self) -> None:
         directory = Directory(
             [Company(f'http://localhost:{self.PORT}/index.html', './/li', 'p', '', '', '', '')],
@@ -120,7 +310,62 @@ class CompanyTest(TestCase):
         with self.assertRaises(OSError):
             company.query()
 
+    def test_query_timeout(self) -> None:
+        with socket() as server:
+            # Accept connections, but never respond
+            server.bind(('localhost', 0))
+            server.listen()
+            port = cast(tuple[str, int], server.getsockname())[1]
+            directory = Directory(
+                [Company(f'http://localhost:{port}/', '', '', '', '', '', '', fetch_timeout=0.1)],
+                data_path=self.data_path)
+            company = directory.companies[0]
+            with self.assertRaises(URLError):
+                company.query()
+
+class SQLiteAdStoreTest(TestCase):
+    URL = 'https://example.org/'
+    NOW = datetime(2023, 2, 3, 20)
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.store = SQLiteAdStore(self.data_path)
+
+    def test_put_ads(self) -> None:
+        self.store.put_ads('example.org', self.expected_ads(self.URL, self.NOW))
+
+        ads = self.store.put_ads('example.org',
+                                 self.expected_ads(self.URL, self.NOW + timedelta(hours=1))[1:])
+        self.assertEqual(ads, self.expected_ads(self.URL, self.NOW)[1:])
+        self.assertEqual(self.store.get_ads('example.org'), ads)
+        self.assertIsNotNone(self.store.get_update_time('example.org'))
+
+    def test_get_ads_csv(self) -> None:
+        CSVAdStore(self.data_path).put_ads('example.org', self.expected_ads(self.URL, self.NOW))
+        ads = self.store.get_ads('example.org')
+        self.assertEqual(ads, self.expected_ads(self.URL, self.NOW))
+
+    def test_import_csv(self) -> None:
+        self.store.put_ads('example.org', self.expected_ads(self.URL, self.NOW)[:1])
+        csv_path = self.data_path / 'csv'
+        csv_path.mkdir()
+        CSVAdStore(csv_path).put_ads('example.org',
+                                     self.expected_ads(self.URL, self.NOW + timedelta(hours=1)))
+
+        self.store.import_csv('example.org', csv_path / 'example.org.csv')
+        times = {ad.url: ad.time for ad in self.store.get_ads('example.org')}
+        self.assertEqual(times, {
+            urljoin(self.URL, 'mitte.html'): self.NOW,
+            urljoin(self.URL, 'kreuzberg.html'): self.NOW + timedelta(hours=1)
+        })
+
 class DirectoryTest(TestCase):
+    def test_init_locale(self) -> None:
+        directory = Directory([], data_path=self.data_path, locale='C')
+        self.assertEqual(directory.currency, '¤')
+        with self.assertRaisesRegex(ValueError, 'locale'):
+            Directory([], data_path=self.data_path, locale='foo')
+
     def test_update(self) -> None:
         companies = [
             Company(f'http://happy.localhost:{self.PORT}/index.html', ".//li[@class='ad']",
@@ -132,9 +377,94 @@ class DirectoryTest(TestCase):
         directory = Directory(companies, data_path=self.data_path)
         directory.now = lambda: datetime(2023, 2, 3, 20) # type: ignore[method-assign]
 
-        directory.update()
+        changed = directory.update()
         ads = directory.get_ads()
+        self.assertEqual(changed, companies[:2])
         self.assertEqual(
             ads,
             [*self.expected_ads(companies[0].url, directory.now()),
              *self.expected_ads(companies[1].url, directory.now())])
+
+    def test_update_unchanged(self) -> None:
+        company = Company(f'http://localhost:{self.PORT}/index.html', ".//li[@class='ad']",
+                          'a/@href', 'a', 'span[1]:[^,]*', 'span[2]', 'span[3]')
+        directory = Directory([company], data_path=self.data_path)
+        directory.update()
+        changed = directory.update()
+        self.assertEqual(changed, [])
+
+    def test_update_failing_company(self) -> None:
+        company = Company(f'http://localhost:{self.PORT}/foo', '', '', '', '', '', '')
+        directory = Directory([company], data_path=self.data_path)
+        metrics: list[UpdateMetrics] = []
+        directory.update_hooks.append(metrics.append)
+
+        directory.update()
+        directory.update()
+        retry_time = company.get_retry_time()
+        assert retry_time
+        self.assertGreater(retry_time, datetime.now() + timedelta(minutes=4))
+        self.assertEqual(len(metrics), 1)
+
+    def test_update_metrics(self) -> None:
+        companies = [
+            Company(f'http://happy.localhost:{self.PORT}/index.html', ".//li[@class='ad']",
+                    'a/@href', 'a', 'span[1]:[^,]*', 'span[2]', 'span[3]'),
+            Company(f'http://long.localhost:{self.PORT}/foo', '', '', '', '', '', '')
+        ]
+        directory = Directory(companies, data_path=self.data_path)
+        metrics: list[UpdateMetrics] = []
+        directory.update_hooks.append(metrics.append)
+
+        directory.update()
+        self.assertEqual(metrics[0].cache, 'miss')
+        self.assertGreater(metrics[0].fetched_bytes, 0)
+        self.assertEqual(metrics[0].added_ads, 2)
+        self.assertEqual(set(metrics[0].timings), {'fetch', 'parse', 'extract', 'store'})
+        self.assertEqual(metrics[1].cache, 'error')
+        self.assertFalse(metrics[1].ok)
+        text = (self.data_path / 'metrics.prom').read_text()
+        self.assertIn('flatdir_added_ads{host="happy.localhost"} 2\n', text)
+        self.assertIn('flatdir_update_ok{host="long.localhost"} 0\n', text)
+        self.assertIn('flatdir_document_cache{host="long.localhost",result="error"} 1\n', text)
+
+    def test_get_table(self) -> None:
+        company = Company(f'http://localhost:{self.PORT}/index.html', ".//li[@class='ad']",
+                          'a/@href', 'a', 'span[1]:[^,]*', 'span[2]', 'span[3]')
+        directory = Directory([company], data_path=self.data_path)
+        table = directory.get_table()
+        self.assertIs(directory.get_table(), table)
+
+        directory.update()
+        table = directory.get_table()
+        self.assertEqual(len(table), 2)
+        directory.update()
+        self.assertIs(directory.get_table(), table)
+
+    def test_get_ad_groups(self) -> None:
+        companies = [Company('https://example.org/', '', '', '', '', '', ''),
+                     Company('https://example.com/', '', '', '', '', '', '')]
+        directory = Directory(companies, data_path=self.data_path)
+        now = datetime(2023, 2, 3, 20)
+        directory.store.put_ads('example.org', [
+            Ad('https://example.org/1', 'Cozy flat with balcony', 'Mitte', 2, 1000, now),
+            Ad('https://example.org/2', 'Cozy flat with balcony', 'Mitte', 2, 1000, now)
+        ])
+        directory.store.put_ads('example.com', [
+            Ad('https://example.com/1', 'Cozy flat, balcony', 'mitte', 2, 1000,
+               now + timedelta(hours=1)),
+            Ad('https://example.com/2', 'Cozy flat with balcony', 'Mitte', 3, 1000, now)
+        ])
+
+        groups = directory.get_ad_groups()
+        self.assertEqual([group.hosts for group in groups],
+                         [['example.org', 'example.com'], ['example.org'], ['example.com']])
+        self.assertEqual(groups[0].ad.url, 'https://example.org/1')
+
+class CreateProcessPoolTest(unittest.TestCase):
+    def test(self) -> None:
+        # Do not fork the running test server thread
+        process_pool = create_process_pool(1, mp_context=get_context('forkserver'))
+        self.addCleanup(process_pool.shutdown)
+        handler = process_pool.submit(getsignal, SIGINT).result()
+        self.assertEqual(handler, SIG_IGN)
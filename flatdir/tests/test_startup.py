@@ -0,0 +1,25 @@
+# pylint: disable=missing-docstring
+
+import subprocess
+import sys
+from unittest import TestCase
+
+class StartupTest(TestCase):
+    # Number of modules imported by flatdir on top of a bare interpreter, with some headroom
+    MODULE_BUDGET = 140
+
+    @staticmethod
+    def import_modules(code: str) -> set[str]:
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                                 capture_output=True, check=True, text=True)
+        return {line.rsplit('|', 1)[-1].strip() for line in process.stderr.splitlines()
+                if not line.startswith('import time: self')}
+
+    def test_import(self) -> None:
+        modules = self.import_modules('import flatdir.directory, flatdir.web')
+        self.assertIn('flatdir.web', modules)
+        # Expensive dependencies are only loaded when needed
+        self.assertFalse(
+            modules & {'html5lib', 'http.client', 'jinja2', 'lxml', 'multiprocessing', 'sqlite3',
+                       'urllib.request'})
+        self.assertLessEqual(len(modules - self.import_modules('pass')), self.MODULE_BUDGET)
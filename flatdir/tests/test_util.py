@@ -1,12 +1,50 @@
 # pylint: disable=missing-docstring
 
+import gzip
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from importlib import resources
+import json
+from json import JSONDecodeError
+import os
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from threading import Thread
+from typing import ClassVar
 from unittest import TestCase
+from unittest.mock import patch
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
 from xml.etree import ElementTree
 
-from flatdir.util import copy_resource, query_json, query_xml
+from flatdir.util import (AtomicWriter, HTTPClient, JSONPath, NumberParser, XMLPath, copy_resource,
+                          iter_json, query_json, query_xml, stream_json)
+
+class AtomicWriterTest(TestCase):
+    def setUp(self) -> None:
+        # pylint: disable=consider-using-with
+        self.dir = TemporaryDirectory()
+        self.path = Path(self.dir.name) / 'happy.txt'
+        self.writer = AtomicWriter()
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def test_write_text(self) -> None:
+        self.path.write_text('Purr!\n')
+        self.writer.write_text(self.path, 'Meow!\n')
+        self.assertEqual(self.path.read_text(), 'Meow!\n')
+        self.assertEqual(list(self.path.parent.iterdir()), [self.path]) # type: ignore[misc]
+
+    def test_batch(self) -> None:
+        with self.writer.batch():
+            self.writer.write_text(self.path, 'Meow!\n')
+            self.assertEqual(self.path.read_text(), 'Meow!\n')
+        self.assertEqual(self.path.read_text(), 'Meow!\n')
+
+    def test_write_text_inaccessible_path(self) -> None:
+        with self.assertRaises(FileNotFoundError):
+            self.writer.write_text(self.path / 'grumpy.txt', 'Meow!\n')
 
 class CopyResourceTest(TestCase):
     def setUp(self) -> None:
@@ -23,11 +61,113 @@ class CopyResourceTest(TestCase):
                          {dst / 'happy.txt', dst / 'clowder'}) # type: ignore[misc]
         self.assertEqual((dst / 'happy.txt').read_text(), 'Meow!\n')
 
+    def test_unchanged(self) -> None:
+        src = resources.files(f'{__package__}.res') / 'cats'
+        dst = Path(self.dir.name)
+        copy_resource(src, dst)
+        os.utime(dst / 'happy.txt', (0, 0))
+        copy_resource(src, dst)
+        self.assertEqual((dst / 'happy.txt').stat().st_mtime, 0)
+
+        (dst / 'happy.txt').write_text('Purr!\n')
+        copy_resource(src, dst)
+        self.assertEqual((dst / 'happy.txt').read_text(), 'Meow!\n')
+
     def test_inaccessible_dst(self) -> None:
         with self.assertRaises(IsADirectoryError):
             copy_resource(resources.files(f'{__package__}.res') / 'cats' / 'happy.txt',
                           self.dir.name)
 
+class HTTPClientTest(TestCase):
+    class _RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self) -> None:
+            # pylint: disable=invalid-name
+            # Requests forwarded by a proxy have an absolute URL
+            path = urlsplit(self.path).path
+            if path == '/cats':
+                self.send_response(HTTPStatus.FOUND)
+                self.send_header('Location', '/cats/happy')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            elif path == '/cats/happy':
+                body = gzip.compress(b'Meow!\n')
+                self.send_response(HTTPStatus.OK)
+                self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('X-Port', str(self.client_address[1]))
+                self.send_header('X-User-Agent', self.headers.get('User-Agent', ''))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self.send_error(HTTPStatus.NOT_FOUND)
+
+        def log_message(self, format: str, *args: object) -> None:
+            # Disable logging
+            # pylint: disable=redefined-builtin
+            pass
+
+    URL = 'http://localhost:16161'
+
+    _server: ClassVar[ThreadingHTTPServer]
+
+    @staticmethod
+    def setUpClass() -> None:
+        HTTPClientTest._server = ThreadingHTTPServer(('localhost', 16161),
+                                                     HTTPClientTest._RequestHandler)
+        Thread(target=HTTPClientTest._server.serve_forever).start()
+
+    @staticmethod
+    def tearDownClass() -> None:
+        HTTPClientTest._server.shutdown()
+        HTTPClientTest._server.server_close()
+
+    def setUp(self) -> None:
+        self.client = HTTPClient(user_agent='cat')
+
+    def tearDown(self) -> None:
+        self.client.close()
+
+    def test_get(self) -> None:
+        response = self.client.get(f'{self.URL}/cats')
+        other = self.client.get(f'{self.URL}/cats/happy')
+        self.assertEqual(response.url, f'{self.URL}/cats/happy')
+        self.assertEqual(response.data, b'Meow!\n')
+        self.assertGreater(response.size, 0)
+        self.assertEqual(response.headers['X-User-Agent'], 'cat')
+        self.assertEqual(other.headers['X-Port'], response.headers['X-Port'])
+
+    def test_get_proxy(self) -> None:
+        with patch.dict(os.environ, http_proxy=self.URL, no_proxy='dogs.invalid'):
+            response = self.client.get('http://cats.invalid/cats/happy')
+            with self.assertRaises(URLError):
+                self.client.get('http://www.dogs.invalid/cats/happy')
+        self.assertEqual(response.data, b'Meow!\n')
+
+    def test_get_missing_resource(self) -> None:
+        with self.assertRaises(HTTPError) as cm:
+            self.client.get(f'{self.URL}/dogs')
+        self.assertEqual(cm.exception.code, HTTPStatus.NOT_FOUND)
+
+    def test_get_unreachable_host(self) -> None:
+        with self.assertRaises(URLError):
+            self.client.get('http://localhost:16162/')
+
+class NumberParserTest(TestCase):
+    def setUp(self) -> None:
+        self.parser = NumberParser(',', '.')
+
+    def test_parse(self) -> None:
+        self.assertEqual(self.parser.parse('€1.234,5 per month'), 1234.5)
+
+    def test_parse_no_number(self) -> None:
+        self.assertEqual(self.parser.parse('On request'), 0)
+
+    def test_parse_all(self) -> None:
+        numbers = self.parser.parse_all(['Almost 1,5', 'On request', 3])
+        self.assertEqual(numbers, [1.5, 0, 3]) # type: ignore[misc]
+
 class QueryJSONTest(TestCase):
     def setUp(self) -> None:
         self.cats = [{'name': 'Happy', 'lives': 9}, {'name': 'Grumpy', 'lives': 7}]
@@ -44,6 +184,10 @@ class QueryJSONTest(TestCase):
         values = query_json(self.cats, '*.lives')
         self.assertEqual(values, [9, 7]) # type: ignore[misc]
 
+    def test_compiled_path(self) -> None:
+        values = query_json(self.cats, JSONPath('*.lives'))
+        self.assertEqual(values, [9, 7]) # type: ignore[misc]
+
     def test_missing_item(self) -> None:
         with self.assertRaisesRegex(LookupError, 'foo'):
             query_json(self.cats, '1.name.foo')
@@ -52,6 +196,35 @@ class QueryJSONTest(TestCase):
         with self.assertRaisesRegex(ValueError, 'item'):
             query_json(self.cats, '1.name', int)
 
+class IterJSONTest(TestCase):
+    def test(self) -> None:
+        cats = [{'name': 'Happy'}, 'Grumpy']
+        values = iter_json(cats, '*.name')
+        self.assertEqual(next(values), 'Happy')
+        with self.assertRaisesRegex(LookupError, 'name'):
+            next(values)
+
+class StreamJSONTest(TestCase):
+    def setUp(self) -> None:
+        self.cats = {
+            'cats': [{'name': 'Happy', 'toys': [{'name': 'Ball'}]}, {'name': 'Grumpy', 'toys': []}],
+            'meta': {'count': 2}
+        }
+        self.document = json.dumps(self.cats, indent=4)
+
+    def test(self) -> None:
+        for path in ['cats.*.name', 'cats.1.name', 'cats.*.toys.*', '*', 'meta.count']:
+            values = list(stream_json(self.document, path))
+            self.assertEqual(values, query_json(self.cats, path))
+
+    def test_missing_item(self) -> None:
+        with self.assertRaisesRegex(LookupError, 'foo'):
+            list(stream_json(self.document, 'cats.*.foo'))
+
+    def test_bad_document(self) -> None:
+        with self.assertRaises(JSONDecodeError):
+            list(stream_json('{"cats": [{"name": "Happy"} {"name": "Grumpy"}]}', 'cats.*.name'))
+
 class QueryXMLTest(TestCase):
     def setUp(self) -> None:
         self.tree = ElementTree.fromstring(
@@ -68,6 +241,11 @@ class QueryXMLTest(TestCase):
              for element in elements], # type: ignore[misc]
             ['<name>Happy</name>', '<name>Grumpy</name>']) # type: ignore[misc]
 
+    def test_compiled_path(self) -> None:
+        elements = query_xml(self.tree, XMLPath('cat/@name'))
+        self.assertEqual([element.text for element in elements], # type: ignore[misc]
+                         ['Happy', 'Grumpy']) # type: ignore[misc]
+
     def test_tail(self) -> None:
         elements = query_xml(self.tree, 'cat/tail()')
         self.assertEqual(
@@ -0,0 +1,72 @@
+# pylint: disable=missing-docstring
+
+from datetime import datetime, timedelta
+import json
+from typing import cast
+from xml.etree import ElementTree
+
+from flatdir.directory import Ad, AdStore, Company, Directory
+from flatdir.util import query_json
+from flatdir.web import WebGenerator
+from .test_directory import TestCase
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+
+class WebGeneratorTest(TestCase):
+    NOW = datetime(2023, 2, 3, 20)
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.company = Company('https://example.org/', '', '', '', '', '', '')
+        self.directory = Directory([self.company], data_path=self.data_path)
+        self.store: AdStore = self.directory.store
+        self.store.put_ads(
+            'example.org',
+            [Ad(f'https://example.org/{i}', f'Flat {i}', 'Mitte' if i % 2 else 'Kreuzberg', 2, 1000,
+                self.NOW + timedelta(hours=i))
+             for i in range(5)])
+        self.generator = WebGenerator(self.directory, 'https://flat.example.org', page_size=2)
+        # Load the shared template again, with the cache of this data directory
+        WebGenerator._template = None
+
+    def test_generate(self) -> None:
+        self.generator.generate()
+        web_path = self.generator.path
+        index = (web_path / 'index.html').read_text()
+        self.assertIn('Flat 4', index)
+        self.assertNotIn('Flat 2', index)
+        self.assertIn('index-2.html', index)
+        self.assertIn('Flat 0', (web_path / 'index-3.html').read_text())
+        self.assertIn('Flat 3', (web_path / 'location-mitte.html').read_text())
+        self.assertNotIn('Flat 4', (web_path / 'location-mitte.html').read_text())
+        self.assertTrue((web_path / 'images' / 'icon.png').exists())
+        self.assertTrue(any((self.data_path / 'template-cache').iterdir()))
+
+    def test_generate_unchanged(self) -> None:
+        self.generator.generate()
+        page_path = self.generator.path / 'index.html'
+        page_path.write_text('Meow!')
+        # Remove the oldest ad
+        self.store.put_ads('example.org', self.store.get_ads('example.org')[1:])
+
+        self.generator.generate()
+        self.assertEqual(page_path.read_text(), 'Meow!')
+        self.assertFalse((self.generator.path / 'index-3.html').exists())
+
+    def test_generate_feeds(self) -> None:
+        self.generator.generate()
+        web_path = self.generator.path
+        feed = cast(object, json.loads((web_path / 'feed.json').read_text()))
+        cursor = query_json(feed, '_flatdir.cursor', str)[0]
+        self.assertEqual(query_json(feed, 'items.*.title'),
+                         [f'Flat {i}' for i in reversed(range(5))])
+        atom = ElementTree.parse(web_path / 'feed.atom')
+        self.assertEqual([title.text for title in atom.iterfind(f'{ATOM}entry/{ATOM}title')],
+                         ['Flat 4', 'Flat 3'])
+
+        ad = Ad('https://example.org/5', 'Flat 5', 'Mitte', 2, 1000, self.NOW + timedelta(hours=5))
+        self.store.put_ads('example.org', [*self.store.get_ads('example.org'), ad])
+        self.generator.generate()
+        delta = cast(object, json.loads((web_path / 'since' / f'{cursor}.json').read_text()))
+        self.assertEqual(query_json(delta, 'items.*.title'), ['Flat 5'])
+        self.assertGreater(query_json(delta, '_flatdir.cursor', str)[0], cursor)
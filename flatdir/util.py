@@ -15,17 +15,36 @@
 
 from __future__ import annotations
 
-from collections.abc import Mapping
+from base64 import b64encode
+from collections.abc import Callable, Generator, Iterator, Mapping
+from contextlib import contextmanager
+from dataclasses import dataclass
 from enum import Enum
+import gzip
+from http import HTTPStatus
 from importlib.resources.abc import Traversable
-from itertools import chain
+from io import BytesIO
+from json import JSONDecodeError, JSONDecoder
+from locale import LC_MONETARY, LC_NUMERIC, localeconv, setlocale
 import logging
 from logging import Formatter, LogRecord, StreamHandler
+import os
 from os import PathLike
 from pathlib import Path
+import re
+from secrets import token_hex
 import sys
-from typing import Iterable, Literal, TextIO, TypeVar, cast, overload
+from threading import Lock
+from typing import TYPE_CHECKING, ClassVar, Iterable, Literal, TextIO, TypeVar, cast, overload
+from urllib.error import HTTPError, URLError
+from urllib.parse import SplitResult, unquote, urljoin, urlsplit, urlunsplit
 from xml.etree.ElementTree import Element
+import zlib
+
+if TYPE_CHECKING:
+    from email.message import Message
+    from http.client import HTTPConnection
+    from ssl import SSLContext
 
 FormatStyle = Literal['%', '{', '$']
 
@@ -37,6 +56,82 @@ SELECT_GRAPHIC_RENDITION = 'm'
 NORMAL = 0
 FOREGROUND = 30
 
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_locale_lock = Lock()
+
+class AtomicWriter:
+    """Writer that replaces files atomically.
+
+    A file is written to a temporary file next to it, which is synced to disk and then replaces the
+    file, so readers always see either the complete old or the complete new version, even if the
+    writer or the system crashes.
+
+    After the replacement, its directory is synced, so the new version is durable. Within a
+    :meth:`batch`, syncing directories is instead deferred until the batch ends, where each affected
+    directory is synced once. While the files of a batch may not be durable before the batch ends,
+    their content is, and they are still replaced atomically.
+    """
+
+    def __init__(self) -> None:
+        self._batch_depth = 0
+        self._unsynced: set[Path] = set()
+        self._lock = Lock()
+
+    def write_bytes(self, path: PathLike[str] | str, data: bytes) -> None:
+        """Replace the file at *path* with *data*."""
+        path = Path(path)
+        tmp_path = path.with_name(f'.{path.name}.{token_hex(4)}.tmp')
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            with open(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            tmp_path.replace(path)
+        except:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+        with self._lock:
+            deferred = self._batch_depth > 0
+            if deferred:
+                self._unsynced.add(path.parent)
+        if not deferred:
+            self._sync_directory(path.parent)
+
+    def write_text(self, path: PathLike[str] | str, text: str, encoding: str = 'utf-8') -> None:
+        """Replace the file at *path* with *text*, encoded with *encoding*."""
+        self.write_bytes(path, text.encode(encoding))
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Context manager that syncs the directories of all files written in the context together
+        at its end.
+
+        Batches may be nested, in which case directories are synced at the end of the outermost
+        batch.
+        """
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                directories = set() if self._batch_depth else self._unsynced
+                if not self._batch_depth:
+                    self._unsynced = set()
+            for directory in directories:
+                self._sync_directory(directory)
+
+    @staticmethod
+    def _sync_directory(path: Path) -> None:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
 class Color(Enum):
     """ANSI terminal color."""
     BLACK = 0
@@ -82,6 +177,308 @@ class ColorFormatter(Formatter):
         return (f'{control_sequence(SELECT_GRAPHIC_RENDITION, foreground)}{message}'
                 f'{control_sequence(SELECT_GRAPHIC_RENDITION, NORMAL)}')
 
+class HTTPClient:
+    """HTTP client with persistent connections.
+
+    Connections are kept alive and reused for further requests to the same host, also from different
+    threads. Bodies are requested compressed with gzip or deflate, the encodings the standard
+    library can decode.
+
+    Like with :mod:`urllib.request`, proxies are configured with the environment variables
+    ``http_proxy``, ``https_proxy`` and ``no_proxy``.
+
+    .. attribute:: user_agent
+
+       Product identifier sent with each request.
+
+    .. attribute:: MAX_REDIRECTS
+
+       Maximum number of redirects followed per request.
+    """
+
+    MAX_REDIRECTS: ClassVar[int] = 10
+
+    _REDIRECT_STATUSES: ClassVar[set[int]] = {301, 302, 303, 307, 308}
+
+    def __init__(self, *, user_agent: str = 'flatdir') -> None:
+        self.user_agent = user_agent
+        self._connections: dict[tuple[str, str], list[HTTPConnection]] = {}
+        self._proxies: dict[str, str] | None = None
+        self._ssl_context: SSLContext | None = None
+        self._lock = Lock()
+
+    def get(self, url: str, headers: Mapping[str, str] | None = None, *,
+            timeout: float = 30) -> HTTPResponse:
+        """Request the resource at *url* with additional header fields *headers*.
+
+        Redirects are followed. *timeout* is the time in seconds after which a single blocking
+        operation, like connecting or receiving a chunk of data, is aborted. It does not limit the
+        duration of the whole request.
+
+        If there is a communication problem, a :exc:`urllib.error.URLError` is raised. If the
+        response status is not successful, a :exc:`urllib.error.HTTPError` is raised.
+        """
+        for _ in range(self.MAX_REDIRECTS + 1):
+            components = urlsplit(url)
+            if components.scheme not in {'http', 'https'} or not components.hostname:
+                raise URLError(f'Unknown url type {url}')
+            status, reason, response_headers, body = self._request(
+                components,
+                {'User-Agent': self.user_agent, 'Accept-Encoding': 'gzip, deflate',
+                 **(headers or {})},
+                timeout)
+
+            location = response_headers.get('Location')
+            if status in self._REDIRECT_STATUSES and location:
+                url = urljoin(url, location)
+                continue
+            if not HTTPStatus.OK <= status < HTTPStatus.MULTIPLE_CHOICES:
+                raise HTTPError(url, status, reason, response_headers, BytesIO(body))
+            encoding = response_headers.get('Content-Encoding', '').strip().lower()
+            return HTTPResponse(url, response_headers, self._decode(body, encoding), len(body))
+        raise URLError(f'Too many redirects for {url}')
+
+    def close(self) -> None:
+        """Close all idle connections."""
+        with self._lock:
+            connections = [c for idle in self._connections.values() for c in idle]
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
+
+    def _request(self, components: SplitResult, headers: dict[str, str],
+                 timeout: float) -> tuple[int, str, Message, bytes]:
+        # http.client pulls in ssl and email, so it is deferred until the first request
+        # pylint: disable=import-outside-toplevel
+        from http.client import HTTPException
+        key = (components.scheme, components.netloc)
+        target = urlunsplit(('', '', components.path or '/', components.query, ''))
+        proxy = self._get_proxy(components)
+        if proxy and components.scheme == 'http':
+            # A plain request is forwarded by the proxy
+            target = urlunsplit((*key, components.path or '/', components.query, ''))
+            headers = {**headers, **self._get_proxy_headers(proxy)}
+        with self._lock:
+            idle = self._connections.get(key)
+            connection = idle.pop() if idle else None
+
+        while True:
+            reused = connection is not None
+            if not connection:
+                connection = self._connect(components, proxy, timeout)
+            connection.timeout = timeout
+            if connection.sock:
+                connection.sock.settimeout(timeout)
+            try:
+                connection.request('GET', target, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, HTTPException) as e:
+                connection.close()
+                # The server may have closed an idle connection meanwhile, so retry once with a new
+                # one
+                if reused and isinstance(e, ConnectionError):
+                    connection = None
+                    continue
+                raise URLError(e) from e
+
+            if response.will_close:
+                connection.close()
+            else:
+                with self._lock:
+                    self._connections.setdefault(key, []).append(connection)
+            return response.status, response.reason, response.msg, body
+
+    def _connect(self, components: SplitResult, proxy: SplitResult | None,
+                 timeout: float) -> HTTPConnection:
+        # pylint: disable=import-outside-toplevel
+        from http.client import HTTPConnection, HTTPSConnection
+        if components.scheme == 'http':
+            if proxy:
+                return HTTPConnection(proxy.hostname or '', proxy.port, timeout=timeout)
+            return HTTPConnection(components.netloc, timeout=timeout)
+
+        with self._lock:
+            if not self._ssl_context:
+                import ssl
+                # Share the context, as loading the trusted certificates is expensive
+                self._ssl_context = ssl.create_default_context()
+            context = self._ssl_context
+        if proxy:
+            # Tunnel the encrypted connection through the proxy
+            connection = HTTPSConnection(proxy.hostname or '', proxy.port, timeout=timeout,
+                                         context=context)
+            connection.set_tunnel(components.hostname or '', components.port,
+                                  headers=self._get_proxy_headers(proxy))
+            return connection
+        return HTTPSConnection(components.netloc, timeout=timeout, context=context)
+
+    def _get_proxy(self, components: SplitResult) -> SplitResult | None:
+        # pylint: disable=import-outside-toplevel
+        from urllib.request import getproxies_environment
+        with self._lock:
+            if self._proxies is None:
+                self._proxies = getproxies_environment()
+            proxies = self._proxies
+        proxy = proxies.get(components.scheme)
+        if not proxy:
+            return None
+        # Like urllib.request, bypass the proxy for hosts in no_proxy and their subdomains
+        host = (components.hostname or '').lower()
+        for entry in proxies.get('no', '').split(','):
+            entry = entry.strip().lstrip('.').lower()
+            if entry == '*' or (entry and (host == entry or host.endswith(f'.{entry}'))):
+                return None
+        return urlsplit(proxy if '://' in proxy else f'http://{proxy}')
+
+    @staticmethod
+    def _get_proxy_headers(proxy: SplitResult) -> dict[str, str]:
+        if proxy.username is None:
+            return {}
+        credentials = f'{unquote(proxy.username)}:{unquote(proxy.password or "")}'
+        return {'Proxy-Authorization': f'Basic {b64encode(credentials.encode()).decode()}'}
+
+    @staticmethod
+    def _decode(data: bytes, encoding: str) -> bytes:
+        try:
+            if encoding in {'', 'identity'}:
+                return data
+            if encoding in {'gzip', 'x-gzip'}:
+                return gzip.decompress(data)
+            if encoding == 'deflate':
+                # Some servers send raw deflate data without zlib header
+                try:
+                    return zlib.decompress(data)
+                except zlib.error:
+                    return zlib.decompress(data, -zlib.MAX_WBITS)
+        except (OSError, EOFError, zlib.error) as e:
+            raise URLError(e) from e
+        raise URLError(f'Unknown content encoding {encoding}')
+
+@dataclass
+class HTTPResponse:
+    """Response to an HTTP request.
+
+    .. attribute:: url
+
+       URL of the resource, after any redirects.
+
+    .. attribute:: headers
+
+       Header fields.
+
+    .. attribute:: data
+
+       Decoded body.
+
+    .. attribute:: size
+
+       Number of bytes transferred for the body.
+    """
+
+    url: str
+    headers: Message
+    data: bytes
+    size: int
+
+class JSONPath:
+    """Compiled path for :func:`query_json`.
+
+    .. attribute:: path
+
+       Source dotted path.
+
+    .. attribute:: names
+
+       Path segments.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.names = tuple(path.split('.'))
+
+    def __str__(self) -> str:
+        return self.path
+
+class NumberParser:
+    """Parser of fuzzy numbers in text, like ``Almost 1.5 rooms``.
+
+    The first number in a text is parsed according to a simplified :func:`float` grammar, using the
+    given separators. If there is no number, the result is ``0``.
+
+    .. attribute:: decimal_point
+
+       Decimal point character.
+
+    .. attribute:: thousands_sep
+
+       Thousands separator character, if any.
+    """
+
+    def __init__(self, decimal_point: str = '.', thousands_sep: str = '') -> None:
+        if not decimal_point:
+            raise ValueError('Blank decimal_point')
+        self.decimal_point = decimal_point
+        self.thousands_sep = thousands_sep
+        decimal = re.escape(decimal_point)
+        group = re.escape(thousands_sep)
+        self._pattern = re.compile(rf'\d[{group}\d]*({decimal}\d+)?')
+
+    @staticmethod
+    def from_locale() -> NumberParser:
+        """Create a number parser for the current :data:`locale.LC_NUMERIC` locale."""
+        conv = localeconv()
+        return NumberParser(conv['decimal_point'], conv['thousands_sep'])
+
+    def parse(self, value: str | int | float) -> float:
+        """Parse the first number in *value*.
+
+        Numeric values are returned as they are.
+        """
+        if isinstance(value, (int, float)):
+            return float(value)
+        match = self._pattern.search(value)
+        if not match:
+            return .0
+        text = match[0]
+        if self.thousands_sep:
+            text = text.replace(self.thousands_sep, '')
+        return float(text.replace(self.decimal_point, '.'))
+
+    def parse_all(self, values: Iterable[str | int | float]) -> list[float]:
+        """Parse the first number in each item of *values*."""
+        parse = self.parse
+        return [parse(value) for value in values]
+
+class XMLPath:
+    """Compiled path for :func:`query_xml`.
+
+    .. attribute:: path
+
+       Source path.
+
+    .. attribute:: expression
+
+       ElementTree XPath expression without the pseudo-element.
+
+    .. attribute:: pseudo
+
+       Pseudo-element of the last segment, if any.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        segments = path.split('/')
+        final = segments[-1]
+        self.pseudo = None
+        if final.startswith('@') or final == 'tail()':
+            self.pseudo = final
+            segments.pop()
+        self.expression = '/'.join(segments)
+
+    def __str__(self) -> str:
+        return self.path
+
 def color_stream_handler(
     stream: TextIO = sys.stderr, *, fmt: str | None = None, datefmt: str | None = None,
     style: FormatStyle = '%', validate: bool = True,
@@ -103,33 +500,108 @@ def control_sequence(func: str, arg: int) -> str:
     # See https://en.wikipedia.org/wiki/ANSI_escape_code#CSI_(Control_Sequence_Introducer)_sequences
     return f'\x1b[{arg}{func}'
 
-def copy_resource(src: Traversable, dst: PathLike[str] | str) -> None:
+def copy_resource(
+    src: Traversable, dst: PathLike[str] | str, *, writer: AtomicWriter | None = None
+) -> None:
     """Copy the resource or resource container *src* to the file or directory *dst*.
 
+    Files are written with *writer*, if given. Files which are already up to date are skipped, so
+    their modification time is kept.
+
     An :exc:`OSError` is raised if there is any problem accessing *src* or *dst*.
     """
     dst = Path(dst)
     if src.is_dir():
         dst.mkdir(exist_ok=True)
         for child in src.iterdir():
-            copy_resource(child, dst / child.name)
+            copy_resource(child, dst / child.name, writer=writer)
+        return
+
+    data = src.read_bytes()
+    try:
+        # Comparing the size first avoids reading most changed files
+        if dst.stat().st_size == len(data) and dst.read_bytes() == data:
+            return
+    except FileNotFoundError:
+        pass
+    if writer:
+        writer.write_bytes(dst, data)
     else:
-        dst.write_bytes(src.read_bytes())
+        dst.write_bytes(data)
 
 @overload
-def query_json(value: object, path: str) -> list[object]:
+def iter_json(value: object, path: str | JSONPath) -> Iterator[object]:
     pass
 @overload
-def query_json(value: object, path: str, cls: type[T]) -> list[T]:
+def iter_json(value: object, path: str | JSONPath, cls: type[T]) -> Iterator[T]:
     pass
 @overload
-def query_json(value: object, path: str, cls: tuple[type[T], type[U]]) -> list[T | U]:
+def iter_json(
+    value: object, path: str | JSONPath, cls: tuple[type[T], type[U]]
+) -> Iterator[T | U]:
     pass
 @overload
-def query_json(value: object, path: str, cls: tuple[type[T], type[U], type[V]]) -> list[T | U | V]:
+def iter_json(
+    value: object, path: str | JSONPath, cls: tuple[type[T], type[U], type[V]]
+) -> Iterator[T | U | V]:
+    pass
+def iter_json(
+    value: object, path: str | JSONPath,
+    cls: type[T] | tuple[type[T], type[U]] | tuple[type[T], type[U], type[V]] | None = None
+) -> Iterator[object] | Iterator[T] | Iterator[T | U] | Iterator[T | U | V]:
+    """Iterate over all items of the JSON collection *value* matching *path*.
+
+    Lazy variant of :func:`query_json`, where a :exc:`LookupError` or :exc:`ValueError` is raised
+    only once the offending item is reached.
+    """
+    if isinstance(path, str):
+        path = JSONPath(path)
+    names = path.names
+
+    def query(value: object, depth: int) -> Iterator[object]:
+        if depth == len(names):
+            if cls and not isinstance(value, cls):
+                raise ValueError(f'Bad item type {type(value).__name__} at {path}')
+            yield value
+            return
+
+        name = names[depth]
+        children: Iterable[object]
+        if isinstance(value, dict):
+            obj = cast(dict[str, object], value)
+            # LookupError is passed through
+            children = obj.values() if name == '*' else (obj[name], )
+        elif isinstance(value, list):
+            array = cast(list[object], value)
+            try:
+                children = array if name == '*' else (array[int(name)], )
+            except (IndexError, ValueError):
+                raise LookupError(name) from None
+        else:
+            raise LookupError(name)
+        for child in children:
+            yield from query(child, depth + 1)
+
+    return query(value, 0)
+
+@overload
+def query_json(value: object, path: str | JSONPath) -> list[object]:
+    pass
+@overload
+def query_json(value: object, path: str | JSONPath, cls: type[T]) -> list[T]:
+    pass
+@overload
+def query_json(
+    value: object, path: str | JSONPath, cls: tuple[type[T], type[U]]
+) -> list[T | U]:
+    pass
+@overload
+def query_json(
+    value: object, path: str | JSONPath, cls: tuple[type[T], type[U], type[V]]
+) -> list[T | U | V]:
     pass
 def query_json(
-    value: object, path: str,
+    value: object, path: str | JSONPath,
     cls: type[T] | tuple[type[T], type[U]] | tuple[type[T], type[U], type[V]] | None = None
 ) -> list[object] | list[T] | list[T | U] | list[T | U | V]:
     """Query all items of the JSON collection *value* matching *path*.
@@ -138,30 +610,94 @@ def query_json(
     followed, a :exc:`LookupError` is raised. Optionally, if the queried values are not of the type
     *cls*, a :exc:`ValueError` is raised.
     """
-    def query(value: object, name: str) -> Iterable[object]:
-        if isinstance(value, dict):
-            obj = cast(dict[str, object], value)
-            # LookupError is passed through
-            return obj.values() if name == '*' else (obj[name], )
-        if isinstance(value, list):
-            array = cast(list[object], value)
+    return list(iter_json(value, path, cls) if cls else iter_json(value, path))
+
+def stream_json(document: str, path: str | JSONPath) -> Iterator[object]:
+    """Iterate over all items of the JSON *document* matching *path*, decoding them one at a time.
+
+    In contrast to :func:`iter_json`, the values containing the items are not decoded as a whole, so
+    besides *document* itself, memory is needed for about a single item at a time. Values off
+    *path* are still decoded in order to skip them, and then discarded.
+
+    If *path* cannot be followed, a :exc:`LookupError` is raised. If *document* is not valid JSON,
+    a :exc:`json.JSONDecodeError` is raised.
+    """
+    if isinstance(path, str):
+        path = JSONPath(path)
+    names = path.names
+    decode = cast(Callable[[str, int], tuple[object, int]], JSONDecoder().raw_decode)
+
+    def skip_whitespace(pos: int) -> int:
+        match = _JSON_WHITESPACE.match(document, pos)
+        assert match
+        return match.end()
+
+    def expect(char: str, pos: int) -> int:
+        if not document.startswith(char, pos):
+            raise JSONDecodeError(f'Expecting {char!r} delimiter', document, pos)
+        return skip_whitespace(pos + 1)
+
+    def query(pos: int, depth: int) -> Generator[object, None, int]:
+        # Yield matching items of the value at pos and return the position after the value
+        if depth == len(names):
+            item, pos = decode(document, pos)
+            yield item
+            return skip_whitespace(pos)
+
+        name = names[depth]
+        if document.startswith('{', pos):
+            pos = skip_whitespace(pos + 1)
+            found = False
+            while not document.startswith('}', pos):
+                if not document.startswith('"', pos):
+                    raise JSONDecodeError('Expecting property name enclosed in double quotes',
+                                          document, pos)
+                key, pos = cast(tuple[str, int], decode(document, pos))
+                pos = expect(':', skip_whitespace(pos))
+                if name in ('*', key):
+                    found = True
+                    pos = yield from query(pos, depth + 1)
+                else:
+                    _, pos = decode(document, pos)
+                    pos = skip_whitespace(pos)
+                if not document.startswith('}', pos):
+                    pos = expect(',', pos)
+            if not (found or name == '*'):
+                raise LookupError(name)
+            return skip_whitespace(pos + 1)
+
+        if document.startswith('[', pos):
             try:
-                return array if name == '*' else (array[int(name)], )
-            except (IndexError, ValueError):
+                index = None if name == '*' else int(name)
+            except ValueError:
                 raise LookupError(name) from None
+            pos = skip_whitespace(pos + 1)
+            i = 0
+            while not document.startswith(']', pos):
+                if index is None or i == index:
+                    pos = yield from query(pos, depth + 1)
+                else:
+                    _, pos = decode(document, pos)
+                    pos = skip_whitespace(pos)
+                if not document.startswith(']', pos):
+                    pos = expect(',', pos)
+                i += 1
+            if index is not None and not 0 <= index < i:
+                raise LookupError(name)
+            return skip_whitespace(pos + 1)
+
+        # Validate the value
+        decode(document, pos)
         raise LookupError(name)
 
-    items = [value]
-    for name in path.split('.'):
-        items = list(chain.from_iterable(query(item, name) for item in items))
+    def stream() -> Iterator[object]:
+        pos = yield from query(skip_whitespace(0), 0)
+        if pos != len(document):
+            raise JSONDecodeError('Extra data', document, pos)
 
-    if cls:
-        for item in items:
-            if not isinstance(item, cls):
-                raise ValueError(f'Bad item type {type(item).__name__} at {path}')
-    return items
+    return stream()
 
-def query_xml(element: Element, path: str) -> list[Element]:
+def query_xml(element: Element, path: str | XMLPath) -> list[Element]:
     """Query all children of the XML *element* matching *path*.
 
     *path* is a simplified XPath expression (see
@@ -172,12 +708,8 @@ def query_xml(element: Element, path: str) -> list[Element]:
     * `@name` selects the attribute with *name*
     * `tail()` selects the text immediately following the element
     """
-    pseudo = None
-    segments = path.split('/')
-    final = segments[-1]
-    if final.startswith('@') or final == 'tail()':
-        pseudo = final
-        segments.pop()
+    if isinstance(path, str):
+        path = XMLPath(path)
 
     def query_pseudo(element: Element, pseudo: str | None) -> Element | None:
         if pseudo is None:
@@ -199,7 +731,27 @@ def query_xml(element: Element, path: str) -> list[Element]:
         assert False
 
     try:
-        children = element.findall('/'.join(segments))
+        children = element.findall(path.expression)
     except SyntaxError as e:
         raise SyntaxError(f'Bad path {path}') from e
-    return [result for child in children if (result := query_pseudo(child, pseudo)) is not None]
+    return [
+        result for child in children if (result := query_pseudo(child, path.pseudo)) is not None
+    ]
+
+@contextmanager
+def use_locale(name: str) -> Iterator[None]:
+    """Context manager using the locale *name* for numbers and currency.
+
+    :data:`locale.LC_NUMERIC` and :data:`locale.LC_MONETARY` are set for the whole process, so
+    concurrent uses are serialized. If the locale is not available, a :exc:`locale.Error` is raised.
+    """
+    with _locale_lock:
+        numeric = setlocale(LC_NUMERIC)
+        monetary = setlocale(LC_MONETARY)
+        try:
+            setlocale(LC_NUMERIC, name)
+            setlocale(LC_MONETARY, name)
+            yield
+        finally:
+            setlocale(LC_NUMERIC, numeric)
+            setlocale(LC_MONETARY, monetary)
@@ -0,0 +1,269 @@
+"""Static web directory generation."""
+
+from __future__ import annotations
+
+from datetime import datetime
+from hashlib import sha256
+from importlib import resources
+import json
+from json import JSONDecodeError
+from logging import getLogger
+from pathlib import Path
+import re
+from time import perf_counter
+from typing import TYPE_CHECKING, ClassVar, cast
+from urllib.parse import quote, urlsplit
+from xml.etree import ElementTree
+from xml.etree.ElementTree import Element, SubElement
+
+from .directory import VERSION, Ad, Directory
+from .util import copy_resource
+
+if TYPE_CHECKING:
+    from jinja2 import Template
+
+class WebGenerator:
+    """Generator of the static web directory of a flat ad directory.
+
+    The newest ads are listed on the index page :file:`index.html`, older ones on the pages
+    :file:`index-{n}.html`. Additionally, the ads of each location are listed on the pages
+    :file:`location-{name}.html` and :file:`location-{name}-{n}.html`.
+
+    The ads are also published as JSON Feed (see https://www.jsonfeed.org/), :file:`feed.json`,
+    and as Atom feed of the newest ads, :file:`feed.atom`. Every JSON feed carries a cursor, the
+    publication time of its newest ad, in ``_flatdir.cursor``. To fetch only ads published
+    afterwards, clients may request the delta feed :file:`since/{cursor}.json`. Delta feeds are kept
+    for the last :attr:`MAX_DELTAS` cursors. If a delta feed does not exist, the full feed should be
+    requested instead.
+
+    A file is only written if its content changed since the last generation. The compiled template
+    is shared by all generators of the process. It is loaded by the first generator to render,
+    from :file:`template-cache` in its data directory, which caches it for later processes.
+
+    .. attribute:: directory
+
+       Flat ad directory to publish.
+
+    .. attribute:: url
+
+       Public URL of the web directory.
+
+    .. attribute:: page_size
+
+       Maximum number of ads per page.
+
+    .. attribute:: path
+
+       Path to the web directory.
+
+    .. attribute:: MAX_DELTAS
+
+       Maximum number of delta feeds.
+    """
+
+    MAX_DELTAS: ClassVar[int] = 24
+
+    _template: ClassVar[Template | None] = None
+
+    def __init__(self, directory: Directory, url: str, *, page_size: int = 100) -> None:
+        components = urlsplit(url)
+        if not (components.scheme and components.hostname):
+            raise ValueError(f'Relative url {url}')
+        if page_size < 1:
+            raise ValueError(f'Non-positive page_size {page_size}')
+        self.directory = directory
+        self.url = url
+        self.page_size = page_size
+        self.path = self.directory.data_path / 'web'
+
+        self._manifest_path = self.directory.data_path / 'web-manifest.json'
+        self._template_cache_path = self.directory.data_path / 'template-cache'
+        self._template_digest = sha256(
+            (resources.files(f'{__package__}.res') / 'template.html').read_bytes()).hexdigest()
+
+    def generate(self) -> Path:
+        """Generate the web directory and return the path to the index page."""
+        start = perf_counter()
+        writer = self.directory.writer
+        res = resources.files(f'{__package__}.res')
+        self.path.mkdir(exist_ok=True)
+
+        def ad_key(ad: Ad) -> datetime:
+            return ad.time
+        def location_key(item: tuple[str, str]) -> str:
+            return item[0].casefold()
+
+        # Duplicate ads from different companies are listed once
+        groups = self.directory.get_ad_groups()
+        ads = sorted((group.ad for group in groups), key=ad_key, reverse=True)
+        hosts = {group.ad.url: group.hosts for group in groups}
+        listings: dict[str, tuple[str | None, list[Ad]]] = {'index': (None, ads)}
+        for ad in ads:
+            _, location_ads = listings.setdefault(f'location-{self._slugify(ad.location)}',
+                                                  (ad.location, []))
+            location_ads.append(ad)
+        locations = sorted(((location, quote(f'{stem}.html'))
+                            for stem, (location, _) in listings.items() if location),
+                           key=location_key)
+        statuses = [(company.host, company.url, company.is_ok())
+                    for company in self.directory.companies]
+
+        old_digests, cursors = self._read_manifest()
+        digests: dict[str, str] = {}
+        cursor = self._format_cursor(ads[0].time) if ads else None
+        if cursor and cursor not in cursors:
+            cursors.append(cursor)
+        cursors = cursors[-self.MAX_DELTAS:]
+
+        def is_current(name: str, digest: str) -> bool:
+            digests[name] = digest
+            return old_digests.get(name) == digest and (self.path / name).exists()
+
+        with writer.batch():
+            copy_resource(res / 'fonts', self.path / 'fonts', writer=writer)
+            copy_resource(res / 'images', self.path / 'images', writer=writer)
+
+            for stem, (location, listing_ads) in listings.items():
+                pages = [listing_ads[i:i + self.page_size]
+                         for i in range(0, len(listing_ads), self.page_size)] or [[]]
+                names = [f'{stem}.html', *(f'{stem}-{n}.html' for n in range(2, len(pages) + 1))]
+                for i, page_ads in enumerate(pages):
+                    previous_page = quote(names[i - 1]) if i > 0 else None
+                    next_page = quote(names[i + 1]) if i < len(pages) - 1 else None
+                    digest = self._digest([
+                        VERSION, self._template_digest, self.url, self.directory.title,
+                        self.directory.description, self.directory.extra, self.directory.currency,
+                        statuses, locations, location, previous_page, next_page,
+                        [(ad.url, ad.title, ad.location, ad.rooms, ad.rent, ad.time.isoformat(),
+                          hosts[ad.url])
+                         for ad in page_ads]
+                    ])
+                    if is_current(names[i], digest):
+                        continue
+                    html = self._load_template().render(
+                        directory=self.directory, companies=self.directory.companies,
+                        ads=page_ads, url=self.url, version=VERSION, location=location,
+                        hosts=hosts, locations=locations, previous_page=previous_page,
+                        next_page=next_page)
+                    writer.write_text(self.path / names[i], html)
+                    getLogger(__name__).debug('Generated %s', names[i])
+
+            feeds = {'feed.json': self._render_json_feed(ads, hosts, cursor)}
+            (self.path / 'since').mkdir(exist_ok=True)
+            for since in cursors:
+                feeds[f'since/{since}.json'] = self._render_json_feed(
+                    [ad for ad in ads if self._format_cursor(ad.time) > since], hosts, cursor)
+            feeds['feed.atom'] = self._render_atom_feed(ads[:self.page_size], hosts)
+            for name, content in feeds.items():
+                if not is_current(name, self._digest(content)):
+                    writer.write_text(self.path / name, content)
+                    getLogger(__name__).debug('Generated %s', name)
+
+            for name in old_digests.keys() - digests.keys():
+                (self.path / name).unlink(missing_ok=True)
+            manifest: dict[str, object] = {'digests': digests, 'cursors': cursors}
+            writer.write_text(self._manifest_path, json.dumps(manifest))
+            self.directory.render_time = perf_counter() - start
+            self.directory.write_metrics()
+
+        return self.path / 'index.html'
+
+    def _load_template(self) -> Template:
+        # Load the template on first render, from the compiled code if cached, and share it between
+        # all generators. Jinja2 is imported here too, which saves its import time for no-op runs.
+        if not WebGenerator._template:
+            # pylint: disable=import-outside-toplevel
+            from jinja2 import Environment, FileSystemBytecodeCache, PackageLoader
+            self._template_cache_path.mkdir(exist_ok=True)
+            templates = Environment(
+                autoescape=True, loader=PackageLoader(f'{__package__}.res', '.'),
+                bytecode_cache=FileSystemBytecodeCache(str(self._template_cache_path)))
+            WebGenerator._template = templates.get_template('template.html')
+        return WebGenerator._template
+
+    def _get_description(self) -> str:
+        return self.directory.description.replace('{companies}',
+                                                  str(len(self.directory.companies)))
+
+    def _render_json_feed(self, ads: list[Ad], hosts: dict[str, list[str]],
+                          cursor: str | None) -> str:
+        feed: dict[str, object] = {
+            'version': 'https://jsonfeed.org/version/1.1',
+            'title': self.directory.title,
+            'home_page_url': self.url,
+            'feed_url': f'{self.url}/feed.json',
+            'description': self._get_description(),
+            '_flatdir': {'cursor': cursor},
+            'items': [
+                {
+                    'id': ad.url,
+                    'url': ad.url,
+                    'title': ad.title,
+                    'date_published': ad.time.astimezone().isoformat(),
+                    '_flatdir': {
+                        'host': ad.host,
+                        'hosts': hosts[ad.url],
+                        'location': ad.location,
+                        'rooms': ad.rooms,
+                        'rent': ad.rent
+                    }
+                } for ad in ads
+            ]
+        }
+        return json.dumps(feed, ensure_ascii=False, separators=(',', ':'))
+
+    def _render_atom_feed(self, ads: list[Ad], hosts: dict[str, list[str]]) -> str:
+        def element(parent: Element, tag: str, text: str | None = None,
+                    **attrib: str) -> Element:
+            child = SubElement(parent, tag, attrib)
+            child.text = text
+            return child
+
+        feed = Element('feed', xmlns='http://www.w3.org/2005/Atom')
+        element(feed, 'id', f'{self.url}/')
+        element(feed, 'title', self.directory.title)
+        element(feed, 'subtitle', self._get_description())
+        element(feed, 'updated',
+                (ads[0].time if ads else datetime.fromtimestamp(0)).astimezone().isoformat())
+        element(feed, 'link', href=f'{self.url}/')
+        element(feed, 'link', rel='self', href=f'{self.url}/feed.atom')
+        author = element(feed, 'author')
+        element(author, 'name', self.directory.title)
+        for ad in ads:
+            entry = element(feed, 'entry')
+            element(entry, 'id', ad.url)
+            element(entry, 'title', ad.title)
+            element(entry, 'link', href=ad.url)
+            element(entry, 'published', ad.time.astimezone().isoformat())
+            element(entry, 'updated', ad.time.astimezone().isoformat())
+            element(entry, 'category', term=ad.location)
+            element(entry, 'summary',
+                    f'{ad.location} · {ad.rooms:g} rooms · '
+                    f'{self.directory.currency}{ad.rent:.2f} · {", ".join(hosts[ad.url])}')
+        return ElementTree.tostring(feed, encoding='unicode', xml_declaration=True)
+
+    def _read_manifest(self) -> tuple[dict[str, str], list[str]]:
+        # Return the digests of the generated files and the cursors of the delta feeds
+        try:
+            manifest = cast(object, json.loads(self._manifest_path.read_bytes()))
+        except (FileNotFoundError, JSONDecodeError):
+            return {}, []
+        if not isinstance(manifest, dict):
+            return {}, []
+        manifest = cast(dict[str, object], manifest)
+        digests = manifest.get('digests')
+        cursors = manifest.get('cursors')
+        return (cast(dict[str, str], digests) if isinstance(digests, dict) else {},
+                cast(list[str], cursors) if isinstance(cursors, list) else [])
+
+    @staticmethod
+    def _digest(content: object) -> str:
+        return sha256(json.dumps(content).encode()).hexdigest()
+
+    @staticmethod
+    def _format_cursor(time: datetime) -> str:
+        return time.strftime('%Y%m%dT%H%M%S%f')
+
+    @staticmethod
+    def _slugify(text: str) -> str:
+        return re.sub(r'\W+', '-', text.casefold()).strip('-') or '-'